@@ -4,17 +4,15 @@ import logging
 import os
 import sys
 
-from .api import Api
+from .client import connect
 from .exceptions import (
     MediaTypeNotAvailableError,
-    NoSuchActionError,
+    NoSuchJobError,
     NoSuchNotificationError,
     NoSuchNotificationSkeletonError,
     NotificationStorageError,
 )
-from .sorting import Sorting
 from .severity import Severity
-from .version import __version__
 
 SEVERITIES = {
     Severity.INFO: 'I',
@@ -36,13 +34,26 @@ COLORS = {
 logger = logging.getLogger('cliapp')
 
 
+class VersionAction(argparse.Action):
+    """Print version and exit, version is looked up only when requested"""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help="show program's version number and exit"):
+        super().__init__(option_strings, dest=dest, default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from .version import __version__
+
+        parser.exit(message="{} {}\n".format(parser.prog, __version__))
+
+
 def create_argparser():
     """Create new argument parser"""
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config-file", help="Specify config file")
     parser.add_argument("--config-dict", help="Config as dictionary")
     parser.add_argument("--debug", help="More verbose output", action="store_true")
-    parser.add_argument("--version", action="version", version="%(prog)s {}".format(__version__))
+    parser.add_argument("--no-daemon", dest="use_daemon", help="Don't connect to running daemon", action="store_false")
+    parser.add_argument("--version", action=VersionAction)
 
     subparsers = parser.add_subparsers(help="sub-command help", dest='command')
     subparsers.required = True
@@ -67,11 +78,16 @@ def create_argparser():
 
     group_add = parser_action.add_mutually_exclusive_group(required=True)
     group_add.add_argument('--from-json', metavar='JSON', help='Json string with template variables')
+    group_add.add_argument('--from-jsonl', metavar='FILE', help="File with one notification per line ('-' for stdin), json objects contain template variables in 'data' and override other options")
     group_add.add_argument('--from-env', metavar='ENV_VAR', help='ENV variable which will template variables be read from (not working yet!)')
 
     parser_list = subparsers.add_parser("list", help="List various things")
     parser_list.add_argument("target", help="List stored messages or available templates", choices=["messages", "templates"], nargs="?", default="messages")
-    parser_list.add_argument("--sort", help="Sort notifications by criterion", nargs="?")
+    parser_list.add_argument("--sort", help="Sort notifications by criterion", choices=["timestamp", "severity"], default="timestamp")
+    parser_list.add_argument("--severity", help="Show only messages of given severity", choices=Severity.STANDARD, action="append")
+    parser_list.add_argument("--since", help="Show only messages created since given unix timestamp", type=int)
+    parser_list.add_argument("--limit", help="Show at most given number of messages", type=int)
+    parser_list.add_argument("--offset", help="Skip given number of messages", type=int, default=0)
 
     parser_get = subparsers.add_parser("get", help="Get specific message")
     parser_get.add_argument("msgid", help="ID of notification message")
@@ -80,10 +96,15 @@ def create_argparser():
     parser_get.add_argument("--force-media-type", dest="force_media_type", help="Request media type and don't return default media type in case requested one is not available", action="store_true")
 
     parser_call = subparsers.add_parser("call", help="Call actions on messages")
-    parser_call.add_argument("msgid", help="ID of notification message")
+    parser_call.add_argument("msgid", help="IDs of notification messages", nargs="+")
     parser_call.add_argument("action", help="Name of action")
     parser_call.add_argument("--cmd-args", help="Arguments for command as single string")
 
+    parser_job = subparsers.add_parser("job", help="Show state of job running action command")
+    parser_job.add_argument("job_id", help="ID of job printed by 'call'")
+
+    subparsers.add_parser("compile-templates", help="Precompile plugin templates into bytecode cache")
+
     return parser
 
 
@@ -118,6 +139,52 @@ def print_notification(notification):
     print("Metadata: {}".format(notification['metadata']))
 
 
+def create_from_jsonl(api, path, defaults):
+    """Create notifications from json lines file in single batch"""
+    if path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+
+    items = []
+    line_numbers = []
+    errors = {}
+
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            errors[lineno] = e
+            continue
+
+        if not isinstance(item, dict):
+            errors[lineno] = "Line is not JSON object"
+            continue
+
+        items.append(dict(defaults, **item))
+        line_numbers.append(lineno)
+
+    reports = {}
+    for lineno, result in zip(line_numbers, api.create_many(items)):
+        if result['error']:
+            errors[lineno] = result['error']
+        else:
+            reports[lineno] = "Succesfully created notification '{}'".format(result['id'])
+
+    for lineno, reason in errors.items():
+        reports[lineno] = "Failed to create notification on line {}. Reason: {}".format(lineno, reason)
+
+    for lineno in sorted(reports):
+        print(reports[lineno])
+
+    if errors:
+        sys.exit(1)
+
+
 def setup_logging(loglevel=logging.INFO):
     logging_format = "%(levelname)s: %(message)s"
     logging.basicConfig(level=loglevel, format=logging_format)
@@ -133,12 +200,15 @@ def process_args(parser, args):
 
     logger.debug("Argparser arguments: %s", args)
 
+    # templates are compiled to bytecode cache directly, daemon has no use for it
+    use_daemon = args.use_daemon and args.command != 'compile-templates'
+
     if args.config_dict:
-        api = Api(confdict=json.loads(args.config_dict))
+        api = connect(confdict=json.loads(args.config_dict), use_daemon=use_daemon)
     elif args.config_file:
-        api = Api(conffile=os.path.abspath(args.config_file))
+        api = connect(conffile=os.path.abspath(args.config_file), use_daemon=use_daemon)
     else:
-        api = Api()
+        api = connect(use_daemon=use_daemon)
 
     if args.command == 'add':
         if args.from_env:
@@ -147,7 +217,6 @@ def process_args(parser, args):
 
         opts = {
             'skel_id': args.template,
-            'data': json.loads(args.from_json),
         }
 
         if args.persistent:
@@ -161,6 +230,12 @@ def process_args(parser, args):
         if args.default_action:
             opts['default_action'] = args.default_action
 
+        if args.from_jsonl:
+            create_from_jsonl(api, args.from_jsonl, opts)
+            return
+
+        opts['data'] = json.loads(args.from_json)
+
         try:
             ret = api.create(**opts)
             print("Succesfully created notification '{}'".format(ret))
@@ -173,13 +248,10 @@ def process_args(parser, args):
 
     elif args.command == 'list':
         if args.target == 'messages':
-            ret = api.get_notifications()
-
-            if args.sort:
-                ret = Sorting.sort_by(ret, args.sort)
-            else:
-                # Sorting by timestamp is default sort order
-                ret = Sorting.sort_by(ret, 'timestamp')
+            # only messages on requested page are rendered
+            ret = api.get_notifications(
+                severity=args.severity, since=args.since, sort=args.sort, limit=args.limit, offset=args.offset
+            )
 
             list_notifications(ret)
 
@@ -202,12 +274,28 @@ def process_args(parser, args):
             print(e)
 
     elif args.command == 'call':
+        results = api.call_actions([(msgid, args.action) for msgid in args.msgid], args.cmd_args)
+
+        for result in results:
+            if result['error']:
+                print("Failed to call action on notification: {}".format(result['error']))
+
+        for job_id in dict.fromkeys(r['job'] for r in results if r.get('job')):
+            print("Started job '{}'".format(job_id))
+
+    elif args.command == 'job':
         try:
-            api.call_action(args.msgid, args.action, args.cmd_args)
-        except NoSuchNotificationError as e:
+            job = api.get_job(args.job_id)
+        except NoSuchJobError as e:
             print(e)
-        except NoSuchActionError as e:
-            print("Failed to call action on notification: {}".format(e))
+            sys.exit(1)
+
+        for key in ['id', 'cmd', 'state', 'returncode', 'error']:
+            print("{}: {}".format(key.capitalize(), job[key]))
+
+    elif args.command == 'compile-templates':
+        compiled = api.precompile_templates()
+        print("Compiled {} templates".format(len(compiled)))
 
 
 def main():
@@ -0,0 +1,142 @@
+"""Running of action commands by long-running process"""
+
+import asyncio
+import logging
+import time
+
+from .config import config
+from .jobs import JobStore
+from .supervisor import OutputBuffer, Supervisor
+
+logger = logging.getLogger(__name__)
+
+
+class ActionRunner:
+    """
+    Run action commands as asyncio subprocesses of long-running process
+
+    At most `concurrency` commands run at once, others wait in queue.
+    Commands running longer than configured `cmd_timeout` are terminated
+    (killed if they don't exit in KILL_TIMEOUT). Progress of every job is recorded in `jobs`.
+    """
+    KILL_TIMEOUT = 5
+
+    def __init__(self, jobs, concurrency):
+        self.jobs = jobs
+        self.concurrency = concurrency
+        self.loop = None
+        self.semaphore = None
+        self.tasks = set()
+
+    def submit(self, cmd, cmd_args=None):
+        """Queue command without waiting for it, return id of its job"""
+        record = self.jobs.new(cmd, cmd_args)
+
+        task = asyncio.ensure_future(self._run_job(record))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+        return record['id']
+
+    async def run(self, cmd, cmd_args=None):
+        """Run command and wait for it, return its final job record"""
+        record = self.jobs.new(cmd, cmd_args)
+        await self._run_job(record)
+
+        return record
+
+    async def join(self):
+        """Wait until all submitted jobs are done"""
+        while self.tasks:
+            await asyncio.wait(set(self.tasks))
+
+    async def _run_job(self, record):
+        loop = asyncio.get_event_loop()
+        if loop is not self.loop:
+            # semaphore belongs to event loop
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self.semaphore:
+            try:
+                await self._execute(record)
+            except Exception as e:
+                logger.exception("Job '%s' failed", record['id'])
+                self.jobs.finish(record, JobStore.FAILED, error=str(e))
+
+    async def _execute(self, record):
+        self.jobs.update(record, state=JobStore.RUNNING, started=time.time())
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *Supervisor.split_cmd(record['cmd'], record['cmd_args']),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except (ValueError, OSError) as e:
+            logger.error("Couldn't execute '%s': %s", record['cmd'], e)
+            self.jobs.finish(record, JobStore.FAILED, error=str(e))
+            return
+
+        stdout = OutputBuffer('stdout')
+        stderr = OutputBuffer('stderr')
+        # both streams are drained all the time, so command never blocks on full pipe
+        readers = [
+            asyncio.ensure_future(self._drain(process.stdout, stdout)),
+            asyncio.ensure_future(self._drain(process.stderr, stderr)),
+        ]
+
+        state = JobStore.FINISHED
+        try:
+            # wait() returns only after output pipes are closed too
+            await asyncio.wait_for(process.wait(), config.getint('settings', 'cmd_timeout'))
+        except asyncio.TimeoutError:
+            # process might have exited, but its children still hold pipes open
+            if process.returncode is None:
+                logger.warning("Terminating process due to timeout")
+                state = JobStore.TIMED_OUT
+                await self._stop(process)
+
+        # output pipes might be held open by command's children
+        _, pending = await asyncio.wait(readers, timeout=self.KILL_TIMEOUT)
+        for reader in pending:
+            reader.cancel()
+
+        if process.returncode != 0:
+            logger.error("Process exited with exit code %s", process.returncode)
+            logger.error("stdout: %s", stdout.getvalue())
+            logger.error("stderr: %s", stderr.getvalue())
+
+        self.jobs.finish(record, state, process.returncode, stdout.getvalue(), stderr.getvalue())
+
+    async def _drain(self, stream, output):
+        while True:
+            data = await stream.read(Supervisor.CHUNK_SIZE)
+            if not data:
+                break
+
+            output.write(data)
+
+        output.close()
+
+    async def _stop(self, process):
+        """Terminate process and kill it if it doesn't exit in time"""
+        if await self._signal(process, process.terminate):
+            return
+
+        logger.warning("Killing process which ignored termination")
+        await self._signal(process, process.kill)
+
+    async def _signal(self, process, send):
+        """Send signal to process, return whether it exited in KILL_TIMEOUT"""
+        try:
+            send()
+            await asyncio.wait_for(process.wait(), self.KILL_TIMEOUT)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            # wait() also waits for pipes, which might be held by children
+            return process.returncode is not None
+
+        return True
@@ -1,15 +1,20 @@
 import logging
+import os
 
 from pathlib import Path
 from .config import config
+from .events import aiter_events, iter_events
 from .exceptions import (
     MediaTypeNotAvailableError,
     NoSuchActionError,
+    NoSuchJobError,
     NoSuchNotificationError,
     NoSuchNotificationSkeletonError,
     NotificationStorageError,
+    NotifylibError,
     InvalidOptionsError,
 )
+from .jobs import JobStore
 from .pluginstorage import PluginStorage
 from .notificationstorage import NotificationStorage
 from .notification import Notification
@@ -29,8 +34,11 @@ class Api:
             config.load_from_dict(confdict)
 
         plugin_dir = config.get('settings', 'plugin_dir')
+        bytecode_cache_dir = config.get('settings', 'bytecode_cache_dir')
         volatile_dir = config.get('settings', 'volatile_dir')
         persistent_dir = config.get('settings', 'persistent_dir')
+        storage_backend = config.get('settings', 'storage_backend')
+        render_cache_size = config.getint('settings', 'render_cache_size')
 
         if not Path(plugin_dir).is_dir():
             logger.error("Missing plugin directory %s", plugin_dir)
@@ -42,12 +50,25 @@ class Api:
                 logger.info("Missing %s messages directory '%s', recreating it", name, storage_path)
                 p.mkdir(parents=True, exist_ok=True)
 
-        self.plugins = PluginStorage(plugin_dir)
-        self.notifications = NotificationStorage(volatile_dir, persistent_dir, self.plugins)
+        self.plugins = PluginStorage(plugin_dir, bytecode_cache_dir)
+        self.notifications = NotificationStorage(
+            volatile_dir, persistent_dir, self.plugins, storage_backend, render_cache_size
+        )
+        self.jobs = JobStore(os.path.join(volatile_dir, 'jobs'))
 
-    def get_notifications(self, media_type='plain', lang='en'):
-        """Return all notifications"""
-        return self.notifications.get_all_rendered(media_type, lang)
+    def get_notifications(self, media_type='plain', lang='en', severity=None, persistent=None, since=None, sort=None, limit=None, offset=0):
+        """
+        Return rendered notifications
+
+        Notifications are filtered, sorted and paginated before rendering,
+        so only notifications on requested page are rendered.
+        Without `sort` notifications are returned in storage order.
+        """
+        self.validate_query_opts(severity, sort or 'timestamp')
+
+        return self.notifications.get_rendered_page(
+            media_type, lang, self._as_list(severity), persistent, since, sort, limit, offset
+        )
 
     def get_rendered_notification(self, msgid, media_type='plain', lang='en', force_media_type=False):
         """Get rendered notification of specific media type by id"""
@@ -57,10 +78,77 @@ class Api:
 
         return rendered
 
+    def query_notifications(self, severity=None, persistent=None, since=None, sort='timestamp', limit=None, offset=0):
+        """
+        Return metadata of notifications filtered, sorted and paginated by storage
+
+        Notifications are not rendered, use `get_rendered_notification()` on returned ids
+        """
+        self.validate_query_opts(severity, sort)
+
+        return self.notifications.query(self._as_list(severity), persistent, since, sort, limit, offset)
+
+    def count_notifications(self, severity=None, persistent=None, since=None):
+        """Return number of notifications matching given filters"""
+        self.validate_query_opts(severity)
+
+        return self.notifications.count(self._as_list(severity), persistent, since)
+
+    def get_next_expiry(self):
+        """
+        Return timestamp when the nearest notification expires or None if none of them expires
+
+        Timestamp is in the same form as notification timestamp, compare it with `Notification.now()`
+        """
+        return self.notifications.next_expiry()
+
+    def get_changes(self, since=0):
+        """
+        Return events (created, dismissed, expired) newer than given sequence number
+
+        Raise EventsLostError if some events since then are no longer kept,
+        consumer has to reload notifications in that case
+        """
+        return self.notifications.changes_since(since)
+
+    def get_sequence(self):
+        """Return sequence number of the latest event"""
+        with self.notifications.lock:
+            self.notifications.sync()
+
+            return self.notifications.events.seq
+
+    def subscribe(self, callback):
+        """
+        Call `callback` with every event, return token for `unsubscribe()`
+
+        Events are emitted when notifications are synchronized, i.e. during any Api call
+        """
+        return self.notifications.events.subscribe(callback)
+
+    def unsubscribe(self, token):
+        self.notifications.events.unsubscribe(token)
+
+    def events(self, since=None, poll_interval=1.0):
+        """Generator yielding events as they happen, see `get_changes()`"""
+        return iter_events(self, since, poll_interval)
+
+    def aevents(self, since=None, poll_interval=1.0):
+        """Asynchronous iterator of events as they happen, see `get_changes()`"""
+        return aiter_events(self, since, poll_interval)
+
+    def get_render_cache_stats(self):
+        """Return hit/miss counters and size of rendered notifications cache"""
+        return self.notifications.render_cache.stats()
+
     def get_templates(self):
         """Return notification types from plugins"""
         return self.plugins.get_notification_types()
 
+    def precompile_templates(self):
+        """Compile plugin templates into bytecode cache, return names of compiled templates"""
+        return self.plugins.precompile_templates()
+
     # data manipulation
     def store(self, n):
         """Store already created notification"""
@@ -75,27 +163,62 @@ class Api:
 
         Prefered method for creating notification with minimal knowledge of underlying layers
         """
+        notif = self._new_notification(skel_id, user_opts)
+
+        success = self.notifications.store(notif)
+
+        if not success:
+            raise NotificationStorageError
+
+        return notif.notif_id
+
+    def create_many(self, items):
+        """
+        Create multiple notifications and store them at once
+
+        `items` are dicts with `skel_id` and the same options as `create()` accepts.
+        All items are validated before anything is stored.
+        Return list of dicts with `id` of created notification or `error` message for every item.
+        """
+        results = []
+        notifications = []
+
+        for item in items:
+            opts = dict(item)
+
+            try:
+                notif = self._new_notification(opts.pop('skel_id', None), opts)
+            except (NotifylibError, TypeError) as e:
+                results.append({'id': None, 'error': str(e) or type(e).__name__})
+                continue
+
+            notifications.append(notif)
+            results.append({'id': notif.notif_id, 'error': None})
+
+        if notifications and not self.notifications.store_many(notifications):
+            for result in results:
+                if result['id']:
+                    result['id'] = None
+                    result['error'] = "Failed to store notification"
+
+        return results
+
+    def _new_notification(self, skel_id, user_opts):
+        """Create notification instance based on selected skeleton and validated options"""
         logger.debug("Create new notification: chosen skeleton: %s", skel_id)
         logger.debug("Create new notification: user opts entered: %s", user_opts)
 
-        skel = self.plugins.get_skeleton(skel_id)
+        skel = self.plugins.get_skeleton(skel_id) if isinstance(skel_id, str) else None
 
         if not skel:
-            raise NoSuchNotificationSkeletonError
+            raise NoSuchNotificationSkeletonError("'{}' is not valid notification template".format(skel_id))
 
         self.validate_user_opts(user_opts)
 
         notification_defaults = skel.get_skeleton_defaults()
         notification_defaults.update(user_opts)
 
-        notif = Notification.new(skel, **notification_defaults)
-
-        success = self.notifications.store(notif)
-
-        if not success:
-            raise NotificationStorageError
-
-        return notif.notif_id
+        return Notification.new(skel, **notification_defaults)
 
     def call_action(self, msgid, name, cmd_args=None):
         """
@@ -104,6 +227,43 @@ class Api:
         First try to delete notification file from filesystem.
         If successful, call action. Otherwise skip.
         Eventually delete notification in memory.
+        Return id of job running action command or None if there is nothing to run.
+        """
+        _, cmd = self.prepare_action(msgid, name)
+
+        if cmd:
+            return self.run_cmd(cmd, cmd_args)
+
+        return None
+
+    def run_cmd(self, cmd, cmd_args=None):
+        """Run action command in standalone supervised process, return id of its job"""
+        from .supervisor import Supervisor
+
+        record = self.jobs.new(cmd, cmd_args)
+        Supervisor(self.jobs, record).run(cmd, cmd_args, config.getint('settings', 'cmd_timeout'))
+
+        return record['id']
+
+    def get_job(self, job_id):
+        """
+        Return record of job running action command
+
+        Record contains `state` (queued, running, finished, failed or timeout),
+        `returncode` of finished command and times when job was `created`, `started` and `finished`
+        """
+        record = self.jobs.get(job_id)
+        if not record:
+            raise NoSuchJobError("Job with ID '{}' does not exist".format(job_id))
+
+        return record
+
+    def prepare_action(self, msgid, name):
+        """
+        Remove notification on which action is called
+
+        Return tuple (notification, command of action) or (notification, None)
+        if there is nothing to run, e.g. someone else dismissed it first
         """
         n = self.notifications.get(msgid)
 
@@ -113,23 +273,123 @@ class Api:
         if not n.has_action(name):
             raise NoSuchActionError("Notification does not have action '{}'".format(name))
 
-        # it is possible that notification is cached but don't exist anymore on fs
+        # it is possible that notification is cached but don't exist anymore in backend
         success = self.notifications.remove_from_fs(msgid)
+        cmd = None
 
         if success:
             if name == 'default':
                 name = n.get_default_action()
 
-            skeleton_id = '{}.{}'.format(n.skeleton.plugin_name, n.skeleton.name)
-            skel = self.plugins.get_skeleton(skeleton_id)
-
-            n.call_action(name, skel, cmd_args, False)
+            cmd = n.get_action_to_run(name, self.plugins.get_skeleton(n.get_skeleton_id()))
 
         # eventually delete it in memory
         self.notifications.remove_from_cache(msgid)
 
+        return n, cmd
+
+    def call_actions(self, calls, cmd_args=None):
+        """
+        Call actions on multiple notifications at once
+
+        `calls` is list of (msgid, action name) pairs. Notifications are looked up
+        after single sync and removed from backend in one batch.
+        Identical commands of multiple actions are run only once.
+        Return list of dicts with full `id` or `error` message for every call
+        and `job` running its command (if any).
+        """
+        results, commands = self.prepare_actions(calls)
+
+        jobs = {}
+        for cmd, nids in commands.items():
+            jobs.update(dict.fromkeys(nids, self.run_cmd(cmd, cmd_args)))
+
+        return self.assign_jobs(results, jobs)
+
+    @staticmethod
+    def assign_jobs(results, jobs):
+        """Fill in ids of jobs in results of `prepare_actions()`, `jobs` maps notification ids to job ids"""
+        for result in results:
+            if result['id'] in jobs:
+                result['job'] = jobs[result['id']]
+
+        return results
+
+    def prepare_actions(self, calls):
+        """
+        Remove notifications on which actions are called
+
+        Return tuple (results, commands) where results are the same as `call_actions()` returns
+        and commands map every distinct command to be run to ids of its notifications
+        """
+        found = self.notifications.get_many(msgid for msgid, _ in calls)
+
+        results = []
+        to_remove = {}
+        actions = []
+
+        for msgid, name in calls:
+            n = found[msgid]
+
+            if not n:
+                results.append({'id': None, 'error': "Notification with ID '{}' does not exist".format(msgid), 'job': None})
+                continue
+
+            if not n.has_action(name):
+                results.append({'id': None, 'error': "Notification does not have action '{}'".format(name), 'job': None})
+                continue
+
+            results.append({'id': n.notif_id, 'error': None, 'job': None})
+
+            if n.notif_id not in to_remove:
+                to_remove[n.notif_id] = n
+                actions.append((n, name))
+
+        removed = self.notifications.remove_many(list(to_remove.values()))
+
+        commands = {}
+        for n, name in actions:
+            # notification might have been already dismissed by someone else
+            if n.notif_id not in removed:
+                continue
+
+            if name == 'default':
+                name = n.get_default_action()
+
+            cmd = n.get_action_to_run(name, self.plugins.get_skeleton(n.get_skeleton_id()))
+            if cmd:
+                commands.setdefault(cmd, []).append(n.notif_id)
+
+        return results, commands
+
+    def dismiss_many(self, msgids):
+        """Dismiss multiple notifications at once, return the same results as `call_actions()`"""
+        return self.call_actions([(msgid, 'dismiss') for msgid in msgids])
+
+    @staticmethod
+    def _as_list(value):
+        if value is None or isinstance(value, (list, tuple, set)):
+            return value
+
+        return [value]
+
+    def validate_query_opts(self, severity=None, sort='timestamp'):
+        for sev in self._as_list(severity) or []:
+            if sev not in Severity.STANDARD:
+                raise InvalidOptionsError("Invalid severity level '{}'".format(sev))
+
+        if sort not in self.notifications.SORT_KEYS:
+            raise InvalidOptionsError("Invalid sort criterion '{}'".format(sort))
+
     def validate_user_opts(self, opts):
-        # TODO: validate all user entered options properly
+        """Raise InvalidOptionsError if options can't be used to create notification"""
+        if not isinstance(opts.get('data', {}), dict):
+            raise InvalidOptionsError("Notification data must be object")
+
+        timeout = opts.get('timeout')
+        if timeout is not None and (not isinstance(timeout, int) or isinstance(timeout, bool)):
+            raise InvalidOptionsError("Invalid timeout '{}'".format(timeout))
+
         if 'severity' in opts and opts['severity'] not in Severity.STANDARD:
             logger.warning("Invalid severity level '%s'", opts['severity'])
             raise InvalidOptionsError("Invalid severity level '{}'".format(opts['severity']))
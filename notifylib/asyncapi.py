@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .actionrunner import ActionRunner
+from .api import Api
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncApi:
+    """
+    Api for asyncio applications
+
+    Offers the same operations as coroutines. Disk access and rendering run
+    in bounded thread pool, action commands are run as asyncio subprocesses
+    by ActionRunner. Notification storage is thread-safe, so calls in pool may overlap.
+    """
+
+    def __init__(self, conffile=None, confdict=None, max_workers=2):
+        self.api = Api(conffile, confdict)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.runner = ActionRunner(self.api.jobs, config.getint('settings', 'action_workers'))
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def create(self, skel_id, **user_opts):
+        return await self._run(self.api.create, skel_id, **user_opts)
+
+    async def create_many(self, items):
+        return await self._run(self.api.create_many, items)
+
+    async def get_notifications(self, media_type='plain', lang='en', **filters):
+        return await self._run(self.api.get_notifications, media_type, lang, **filters)
+
+    async def get_rendered_notification(self, msgid, media_type='plain', lang='en', force_media_type=False):
+        return await self._run(self.api.get_rendered_notification, msgid, media_type, lang, force_media_type)
+
+    async def query_notifications(self, **filters):
+        return await self._run(self.api.query_notifications, **filters)
+
+    async def count_notifications(self, **filters):
+        return await self._run(self.api.count_notifications, **filters)
+
+    async def get_templates(self):
+        return await self._run(self.api.get_templates)
+
+    async def get_next_expiry(self):
+        return await self._run(self.api.get_next_expiry)
+
+    async def get_changes(self, since=0):
+        return await self._run(self.api.get_changes, since)
+
+    async def get_sequence(self):
+        return await self._run(self.api.get_sequence)
+
+    async def get_job(self, job_id):
+        return await self._run(self.api.get_job, job_id)
+
+    async def call_action(self, msgid, name, cmd_args=None):
+        """Call action on notification and wait until its command finishes, return id of its job"""
+        _, cmd = await self._run(self.api.prepare_action, msgid, name)
+
+        if cmd:
+            record = await self.runner.run(cmd, cmd_args)
+            return record['id']
+
+        return None
+
+    async def call_actions(self, calls, cmd_args=None):
+        """The same as `Api.call_actions()`, distinct commands are run concurrently"""
+        results, commands = await self._run(self.api.prepare_actions, calls)
+
+        records = await asyncio.gather(*(self.runner.run(cmd, cmd_args) for cmd in commands))
+
+        jobs = {}
+        for nids, record in zip(commands.values(), records):
+            jobs.update(dict.fromkeys(nids, record['id']))
+
+        return self.api.assign_jobs(results, jobs)
+
+    async def dismiss_many(self, msgids):
+        return await self.call_actions([(msgid, 'dismiss') for msgid in msgids])
+
+    async def run_cmd(self, cmd, cmd_args=None):
+        """
+        Run action command and wait for it, command is terminated after configured timeout
+
+        Return exit code of command or None if it couldn't be run
+        """
+        record = await self.runner.run(cmd, cmd_args)
+
+        return record['returncode']
+
+    async def aevents(self, since=None, poll_interval=1.0):
+        """
+        Asynchronous iterator of events as they happen
+
+        Without `since` events newer than state at the start of iteration are yielded
+        """
+        seq = await self.get_sequence() if since is None else since
+
+        while True:
+            for event in await self.get_changes(seq):
+                seq = event['seq']
+                yield event
+
+            await asyncio.sleep(poll_interval)
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,23 @@
+import os
+
+import jinja2
+
+
+class MtimeBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    Filesystem bytecode cache keyed also by mtime of template file
+
+    Compiled template is invalidated when template file is touched
+    even if jinja would otherwise reuse it based on source checksum.
+    """
+
+    def get_cache_key(self, name, filename=None):
+        if filename:
+            try:
+                mtime = os.stat(filename).st_mtime_ns
+            except OSError:
+                mtime = 0
+
+            name = '{}:{}'.format(name, mtime)
+
+        return super().get_cache_key(name, filename)
@@ -0,0 +1,180 @@
+"""Client of notification daemon"""
+
+import json
+import logging
+import os
+import socket
+
+from . import exceptions
+from .config import config
+from .events import aiter_events, iter_events
+from .exceptions import DaemonError, NotifylibError
+
+logger = logging.getLogger(__name__)
+
+
+class ApiClient:
+    """
+    Proxy of Api running in notification daemon
+
+    Offers the same methods as daemon serves and raises the same exceptions as Api
+    """
+    TIMEOUT = 30
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.sock = None
+        self.stream = None
+
+    def connect(self):
+        """Connect to daemon, raise OSError if it is not running"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.TIMEOUT)
+
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+
+        self.sock = sock
+        self.stream = sock.makefile('rwb')
+
+    def close(self):
+        if self.sock:
+            self.stream.close()
+            self.sock.close()
+            self.sock = None
+            self.stream = None
+
+    def _call(self, method, **params):
+        if not self.sock:
+            self.connect()
+
+        request = json.dumps({'method': method, 'params': params})
+
+        try:
+            self.stream.write(request.encode() + b'\n')
+            self.stream.flush()
+            line = self.stream.readline()
+        except OSError as e:
+            self.close()
+            raise DaemonError("Communication with daemon failed: {}".format(e))
+
+        if not line:
+            self.close()
+            raise DaemonError("Daemon closed connection")
+
+        response = json.loads(line)
+
+        if 'error' in response:
+            raise self._exception(response['error'])
+
+        return response['result']
+
+    @staticmethod
+    def _exception(error):
+        """Return exception of the same type as was raised in daemon"""
+        exc_class = getattr(exceptions, error['type'], None)
+
+        if isinstance(exc_class, type) and issubclass(exc_class, NotifylibError):
+            return exc_class(error['message'])
+
+        return DaemonError(error['message'])
+
+    def create(self, skel_id, **user_opts):
+        return self._call('create', skel_id=skel_id, **user_opts)
+
+    def create_many(self, items):
+        return self._call('create_many', items=items)
+
+    def get_notifications(self, media_type='plain', lang='en', severity=None, persistent=None, since=None, sort=None, limit=None, offset=0):
+        return self._call(
+            'get_notifications', media_type=media_type, lang=lang, severity=severity, persistent=persistent,
+            since=since, sort=sort, limit=limit, offset=offset
+        )
+
+    def get_rendered_notification(self, msgid, media_type='plain', lang='en', force_media_type=False):
+        return self._call(
+            'get_rendered_notification', msgid=msgid, media_type=media_type, lang=lang, force_media_type=force_media_type
+        )
+
+    def query_notifications(self, severity=None, persistent=None, since=None, sort='timestamp', limit=None, offset=0):
+        return self._call(
+            'query_notifications', severity=severity, persistent=persistent, since=since, sort=sort, limit=limit, offset=offset
+        )
+
+    def count_notifications(self, severity=None, persistent=None, since=None):
+        return self._call('count_notifications', severity=severity, persistent=persistent, since=since)
+
+    def get_next_expiry(self):
+        return self._call('get_next_expiry')
+
+    def get_changes(self, since=0):
+        return self._call('get_changes', since=since)
+
+    def get_sequence(self):
+        return self._call('get_sequence')
+
+    def events(self, since=None, poll_interval=1.0):
+        return iter_events(self, since, poll_interval)
+
+    def aevents(self, since=None, poll_interval=1.0):
+        return aiter_events(self, since, poll_interval)
+
+    def get_templates(self):
+        return self._call('get_templates')
+
+    def call_action(self, msgid, name, cmd_args=None):
+        return self._call('call_action', msgid=msgid, name=name, cmd_args=cmd_args)
+
+    def call_actions(self, calls, cmd_args=None):
+        return self._call('call_actions', calls=[list(c) for c in calls], cmd_args=cmd_args)
+
+    def dismiss_many(self, msgids):
+        return self._call('dismiss_many', msgids=list(msgids))
+
+    def get_job(self, job_id):
+        return self._call('get_job', job_id=job_id)
+
+
+def _trusted_socket(path):
+    """Check that socket exists and belongs to root or current user, so it can't be spoofed by other users"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+
+    if st.st_uid not in (0, os.getuid()):
+        logger.warning("Ignoring daemon socket '%s' owned by another user", path)
+        return False
+
+    return True
+
+
+def connect(conffile=None, confdict=None, use_daemon=True):
+    """
+    Return client of running daemon or in-process Api if daemon is not available
+
+    Both provide the same interface for creating, listing and calling actions
+    """
+    if conffile:
+        config.load_from_file(conffile)
+    elif confdict:
+        config.load_from_dict(confdict)
+
+    if use_daemon:
+        socket_path = config.get('settings', 'socket_path')
+
+        if _trusted_socket(socket_path):
+            client = ApiClient(socket_path)
+
+            try:
+                client.connect()
+                return client
+            except OSError as e:
+                logger.debug("Daemon is not available: %s", e)
+
+    from .api import Api
+
+    return Api()
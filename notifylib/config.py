@@ -17,6 +17,14 @@ class Config:
         self.conf.set("settings", "persistent_dir", "/srv/notification-system")
         self.conf.set("settings", "plugin_dir", os.path.join(self.module_path, 'plugins'))
         self.conf.set("settings", "cmd_timeout", "10")
+        self.conf.set("settings", "action_workers", "4")
+        self.conf.set("settings", "watcher", "auto")
+        self.conf.set("settings", "storage_backend", "files")
+        self.conf.set("settings", "file_format", "1")
+        self.conf.set("settings", "render_cache_size", "1024")
+        self.conf.set("settings", "load_workers", "4")
+        self.conf.set("settings", "bytecode_cache_dir", "/var/cache/notification-system")
+        self.conf.set("settings", "socket_path", "/var/run/notification-system.sock")
 
     def load_from_file(self, filename):
         try:
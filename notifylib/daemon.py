@@ -0,0 +1,248 @@
+"""Long-running daemon serving notification Api over unix socket"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+
+from .actionrunner import ActionRunner
+from .api import Api
+from .config import config
+from .exceptions import NotifylibError
+from .notification import Notification
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDaemon:
+    """
+    Serve single in-memory Api instance over unix socket
+
+    Protocol is line-delimited json. Request is object with `method` and `params`,
+    response contains either `result` or `error` with exception `type` and `message`.
+    Requests are processed one by one in event loop, so Api is never accessed concurrently.
+    Action commands are run by daemon's ActionRunner, call returns ids of their jobs right away.
+    """
+    METHODS = [
+        'create',
+        'create_many',
+        'get_notifications',
+        'get_rendered_notification',
+        'query_notifications',
+        'count_notifications',
+        'get_next_expiry',
+        'get_changes',
+        'get_sequence',
+        'get_templates',
+        'call_action',
+        'call_actions',
+        'dismiss_many',
+        'get_job',
+    ]
+    # methods handled by daemon itself to run commands without forking
+    RUNNER_METHODS = ['call_action', 'call_actions', 'dismiss_many']
+    # requests with many notifications might be long
+    LINE_LIMIT = 16 * 1024 * 1024
+    SOCKET_MODE = 0o660
+    # notifications created by other processes are noticed at least this often
+    MAX_EXPIRY_WAIT = 60
+    # methods which might add notification expiring sooner than currently scheduled one
+    SCHEDULING_METHODS = ['create', 'create_many']
+
+    def __init__(self, api, socket_path):
+        self.api = api
+        self.socket_path = socket_path
+        self.loop = None
+        self.server = None
+        self.stop_event = None
+        self.expiry_task = None
+        self.schedule_changed = None
+        self.runner = ActionRunner(api.jobs, config.getint('settings', 'action_workers'))
+
+    def dispatch(self, request):
+        """Call Api method requested by client and return response"""
+        try:
+            method = request['method']
+            params = request.get('params', {})
+        except (KeyError, TypeError):
+            return {'error': {'type': 'InvalidRequest', 'message': 'Malformed request'}}
+
+        if method not in self.METHODS:
+            return {'error': {'type': 'InvalidRequest', 'message': "Unknown method '{}'".format(method)}}
+
+        target = self if method in self.RUNNER_METHODS else self.api
+
+        try:
+            return {'result': getattr(target, method)(**params)}
+        except NotifylibError as e:
+            return {'error': {'type': type(e).__name__, 'message': str(e)}}
+        except TypeError as e:
+            return {'error': {'type': 'InvalidRequest', 'message': str(e)}}
+        except Exception as e:
+            # daemon has to keep serving other requests
+            logger.exception("Request '%s' failed", method)
+            return {'error': {'type': type(e).__name__, 'message': str(e)}}
+
+    def call_action(self, msgid, name, cmd_args=None):
+        _, cmd = self.api.prepare_action(msgid, name)
+
+        if cmd:
+            return self.runner.submit(cmd, cmd_args)
+
+        return None
+
+    def call_actions(self, calls, cmd_args=None):
+        results, commands = self.api.prepare_actions(calls)
+
+        jobs = {}
+        for cmd, nids in commands.items():
+            jobs.update(dict.fromkeys(nids, self.runner.submit(cmd, cmd_args)))
+
+        return self.api.assign_jobs(results, jobs)
+
+    def dismiss_many(self, msgids):
+        return self.call_actions([(msgid, 'dismiss') for msgid in msgids])
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as e:
+                    # StreamReader.readline() reports exceeded line limit by ValueError
+                    logger.warning("Client request too long: %s", e)
+                    writer.write(self.encode({'error': {'type': 'InvalidRequest', 'message': 'Request too long'}}))
+                    await writer.drain()
+                    break
+
+                if not line:
+                    break
+
+                writer.write(self.encode(self.process(line)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.warning("Client connection failed: %s", e)
+        finally:
+            writer.close()
+
+    def process(self, line):
+        """Return response to single request line"""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {'error': {'type': 'InvalidRequest', 'message': 'Invalid json'}}
+
+        logger.debug("Request: %s", request.get('method') if isinstance(request, dict) else request)
+        response = self.dispatch(request)
+
+        if isinstance(request, dict) and request.get('method') in self.SCHEDULING_METHODS:
+            self.schedule_changed.set()
+
+        return response
+
+    @staticmethod
+    def encode(response):
+        try:
+            return json.dumps(response).encode() + b'\n'
+        except (TypeError, ValueError) as e:
+            logger.exception("Failed to serialize response")
+            return json.dumps({'error': {'type': type(e).__name__, 'message': str(e)}}).encode() + b'\n'
+
+    async def expire_notifications(self):
+        """Remove expired notifications as soon as they expire"""
+        while not self.stop_event.is_set():
+            self.schedule_changed.clear()
+
+            try:
+                # expired notifications are removed during sync
+                expiry = self.api.get_next_expiry()
+            except Exception:
+                logger.exception("Failed to remove expired notifications")
+                expiry = None
+
+            if expiry is None:
+                delay = self.MAX_EXPIRY_WAIT
+            else:
+                delay = min(max(expiry - Notification.now(), 0), self.MAX_EXPIRY_WAIT)
+
+            waiter = self.loop.create_task(self.schedule_changed.wait())
+            await asyncio.wait({waiter}, timeout=delay)
+            waiter.cancel()
+
+    async def start(self):
+        """Start listening on socket"""
+        self.loop = asyncio.get_event_loop()
+        self.stop_event = asyncio.Event()
+        self.schedule_changed = asyncio.Event()
+
+        if os.path.exists(self.socket_path):
+            # stale socket of previous instance
+            os.unlink(self.socket_path)
+
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path, limit=self.LINE_LIMIT)
+        os.chmod(self.socket_path, self.SOCKET_MODE)
+        logger.info("Listening on '%s'", self.socket_path)
+
+        self.expiry_task = self.loop.create_task(self.expire_notifications())
+
+    async def wait_stopped(self):
+        """Serve clients until stop() is called and clean up afterwards"""
+        try:
+            await self.stop_event.wait()
+        finally:
+            # wake up expiry timer so it notices stop
+            self.stop_event.set()
+            self.schedule_changed.set()
+            await self.expiry_task
+
+            self.server.close()
+            await self.server.wait_closed()
+
+            # commands already submitted are finished (or timed out)
+            await self.runner.join()
+
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    async def serve(self):
+        await self.start()
+        await self.wait_stopped()
+
+    def stop(self):
+        """Stop serving, safe to call from signal handler or another thread"""
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification system daemon")
+    parser.add_argument("-c", "--config-file", help="Specify config file")
+    parser.add_argument("--socket", help="Path of unix socket, overrides config")
+    parser.add_argument("--debug", help="More verbose output", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(levelname)s: %(message)s"
+    )
+
+    if args.config_file:
+        api = Api(conffile=os.path.abspath(args.config_file))
+    else:
+        api = Api()
+
+    daemon = NotificationDaemon(api, args.socket or config.get('settings', 'socket_path'))
+
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, daemon.stop)
+
+    loop.run_until_complete(daemon.serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import itertools
+import logging
+import time
+
+from collections import deque
+
+from .exceptions import EventsLostError
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+    """
+    Bounded log of changes of stored notifications
+
+    Every event gets sequence number increasing by one, so consumer can ask
+    for changes since the last event it has seen. Events are formatted
+    only when someone reads them, so loading many notifications is cheap.
+    """
+    CREATED = 'created'
+    DISMISSED = 'dismissed'
+    EXPIRED = 'expired'
+
+    def __init__(self, formatter, maxlen=1024):
+        self.formatter = formatter
+        self.seq = 0
+        # (seq, type, notification)
+        self.events = deque(maxlen=maxlen)
+        self.subscribers = {}
+        self.tokens = itertools.count(1)
+
+    def _format(self, seq, event_type, n):
+        return {
+            'seq': seq,
+            'type': event_type,
+            'notification': self.formatter(n),
+        }
+
+    def emit(self, event_type, n):
+        self.seq += 1
+        self.events.append((self.seq, event_type, n))
+
+        if not self.subscribers:
+            return
+
+        event = self._format(self.seq, event_type, n)
+
+        for callback in list(self.subscribers.values()):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Subscriber failed to process event")
+
+    def since(self, seq):
+        """
+        Return events newer than given sequence number
+
+        Raise EventsLostError if some of them were already dropped from log
+        or if sequence number comes from log of another process (e.g. restarted daemon)
+        """
+        if seq > self.seq:
+            raise EventsLostError("Unknown sequence number {}, the latest one is {}".format(seq, self.seq))
+
+        if seq == self.seq:
+            return []
+
+        first = self.events[0][0] if self.events else self.seq + 1
+        if seq + 1 < first:
+            raise EventsLostError("Events since {} are no longer available, the oldest one is {}".format(seq, first))
+
+        return [self._format(*e) for e in itertools.islice(self.events, seq + 1 - first, None)]
+
+    def subscribe(self, callback):
+        """Call `callback` with every new event, return token for `unsubscribe()`"""
+        token = next(self.tokens)
+        self.subscribers[token] = callback
+
+        return token
+
+    def unsubscribe(self, token):
+        self.subscribers.pop(token, None)
+
+
+def iter_events(api, since=None, poll_interval=1.0):
+    """
+    Return generator yielding events of given Api or ApiClient as they happen
+
+    Without `since` only events newer than current state are yielded.
+    EventsLostError is raised when consumer is too slow, it has to reload
+    notifications and start again.
+    """
+    seq = api.get_sequence() if since is None else since
+
+    return _iter_events(api, seq, poll_interval)
+
+
+def _iter_events(api, seq, poll_interval):
+    while True:
+        for event in api.get_changes(seq):
+            seq = event['seq']
+            yield event
+
+        time.sleep(poll_interval)
+
+
+def aiter_events(api, since=None, poll_interval=1.0):
+    """Asynchronous variant of `iter_events()`, blocking calls are run in executor"""
+    seq = api.get_sequence() if since is None else since
+
+    return _aiter_events(api, seq, poll_interval)
+
+
+async def _aiter_events(api, seq, poll_interval):
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+
+    while True:
+        for event in await loop.run_in_executor(None, api.get_changes, seq):
+            seq = event['seq']
+            yield event
+
+        await asyncio.sleep(poll_interval)
@@ -40,3 +40,15 @@ class VersionMismatchError(NotifylibError):
 
 class InvalidOptionsError(NotifylibError):
     pass
+
+
+class DaemonError(NotifylibError):
+    pass
+
+
+class EventsLostError(NotifylibError):
+    pass
+
+
+class NoSuchJobError(NotifylibError):
+    pass
@@ -0,0 +1,120 @@
+"""Records of action commands run in background"""
+
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """
+    Records of action commands (jobs) stored as json files
+
+    Records are kept in volatile storage, so they are shared by all processes
+    running actions (daemon, standalone supervisor) and readable by any Api.
+    Records older than RETENTION are removed from time to time.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    # command exited, see `returncode`
+    FINISHED = 'finished'
+    # command couldn't be started, see `error`
+    FAILED = 'failed'
+    # command was terminated due to timeout
+    TIMED_OUT = 'timeout'
+
+    RETENTION = 24 * 3600
+    CLEANUP_INTERVAL = 3600
+
+    def __init__(self, jobs_dir):
+        self.jobs_dir = jobs_dir
+        self.last_cleanup = None
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, '{}.json'.format(job_id))
+
+    def new(self, cmd, cmd_args=None):
+        """Create record of queued job and return it"""
+        self.cleanup()
+
+        record = {
+            'id': uuid.uuid4().hex,
+            'cmd': cmd,
+            'cmd_args': cmd_args,
+            'state': self.QUEUED,
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'returncode': None,
+            'error': None,
+            'duration': None,
+            'stdout': None,
+            'stderr': None,
+        }
+        self.save(record)
+
+        return record
+
+    def update(self, record, **changes):
+        """Change and save job record"""
+        record.update(changes)
+        self.save(record)
+
+    def finish(self, record, state, returncode=None, stdout=None, stderr=None, error=None):
+        """Record result of job, captured output is expected to be already truncated"""
+        finished = time.time()
+        duration = finished - record['started'] if record['started'] else None
+
+        self.update(
+            record, state=state, returncode=returncode, error=error,
+            finished=finished, duration=duration, stdout=stdout, stderr=stderr,
+        )
+
+    def save(self, record):
+        # readers never see partially written record
+        path = self._path(record['id'])
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+
+        try:
+            os.makedirs(self.jobs_dir, mode=0o700, exist_ok=True)
+
+            with open(tmp_path, 'w') as f:
+                json.dump(record, f)
+
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error("Failed to save record of job '%s': %s", record['id'], e)
+
+    def get(self, job_id):
+        """Return job record or None if there is no such job"""
+        if not job_id or not job_id.isalnum():
+            return None
+
+        try:
+            with open(self._path(job_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cleanup(self):
+        """Remove records of old jobs, at most once per CLEANUP_INTERVAL"""
+        now = time.time()
+        if self.last_cleanup is not None and now - self.last_cleanup < self.CLEANUP_INTERVAL:
+            return
+
+        self.last_cleanup = now
+
+        try:
+            entries = list(os.scandir(self.jobs_dir))
+        except FileNotFoundError:
+            return
+
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > self.RETENTION:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,324 @@
+import fcntl
+import json
+import logging
+import os
+
+from contextlib import contextmanager
+
+from .exceptions import VersionMismatchError
+from .notification import Notification
+from .storagebackend import StorageBackend, flock
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    Append-only journal file
+
+    Every line is one record in form '<op> <id>[ <json>]'. Skeleton records
+    store skeleton definitions referenced by notifications, their id is hash of definition.
+    Records are only appended so other instances can read just the tail
+    they haven't seen yet. Compaction rewrites journal with live records only.
+    """
+    CREATE = b'create'
+    DISMISS = b'dismiss'
+    DELETE = b'delete'
+    SKELETON = b'skeleton'
+
+    COMPACT_MIN_DEAD = 256
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+
+        self.inode = None
+        self.offset = 0
+        self.live = set()
+        self.dead = 0
+        self.skeletons = {}
+
+        # changes read from journal but not yet picked up by storage
+        self.pending = {}
+
+    @contextmanager
+    def _lock(self, operation):
+        """
+        Advisory lock of journal
+
+        Appends share the lock, exclusive lock is needed for removal and compaction
+        """
+        with flock(self.lock_path, operation):
+            yield
+
+    def _reset(self, inode):
+        """Forget journal state, all records will be read again"""
+        for nid in self.live:
+            self.pending[nid] = None
+
+        self.inode = inode
+        self.offset = 0
+        self.live = set()
+        self.dead = 0
+
+    def catch_up(self):
+        """Read records appended since last call"""
+        try:
+            with open(self.path, 'rb') as f:
+                st = os.fstat(f.fileno())
+
+                if st.st_ino != self.inode or st.st_size < self.offset:
+                    # journal was compacted or replaced
+                    self._reset(st.st_ino)
+
+                if st.st_size == self.offset:
+                    return
+
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            if self.inode is not None:
+                self._reset(None)
+            return
+
+        # last record might not be completely written yet
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+
+        for line in data[:end].splitlines():
+            self._apply(line)
+
+    def _apply(self, line):
+        op, _, rest = line.partition(b' ')
+        nid, _, payload = rest.partition(b' ')
+        nid = nid.decode()
+
+        if op == self.CREATE:
+            self.live.add(nid)
+            self.pending[nid] = payload
+        elif op == self.SKELETON:
+            self.skeletons[nid] = payload
+        elif op in (self.DISMISS, self.DELETE):
+            if nid in self.live:
+                self.live.discard(nid)
+                self.dead += 1
+
+            self.dead += 1
+            self.pending[nid] = None
+        else:
+            logger.warning("Unknown record in journal '%s'", self.path)
+
+    def pop_pending(self):
+        pending = self.pending
+        self.pending = {}
+
+        return pending
+
+    def _write(self, data):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+        finally:
+            os.close(fd)
+
+    def append(self, records):
+        """Append records (op, nid, payload) in one write"""
+        data = b''.join(self._format(*r) for r in records)
+
+        with self._lock(fcntl.LOCK_SH):
+            self._write(data)
+
+    @staticmethod
+    def _format(op, nid, payload=None):
+        if payload is None:
+            return b'%s %s\n' % (op, nid.encode())
+
+        return b'%s %s %s\n' % (op, nid.encode(), payload)
+
+    def remove(self, nid, op):
+        """
+        Append removal record if notification is still live
+
+        Return True if notification was removed by this call
+        """
+        return nid in self.remove_many([nid], op)
+
+    def remove_many(self, nids, op):
+        """
+        Append removal records of notifications which are still live in one write
+
+        Return set of ids removed by this call
+        """
+        with self._lock(fcntl.LOCK_EX):
+            self.catch_up()
+
+            removed = {nid for nid in nids if nid in self.live}
+
+            if removed:
+                self._write(b''.join(self._format(op, nid) for nid in removed))
+
+        if self.dead >= self.COMPACT_MIN_DEAD and self.dead > len(self.live):
+            self.compact()
+
+        return removed
+
+    def compact(self):
+        """Rewrite journal to contain only records of live notifications"""
+        tmp_path = self.path + '.tmp'
+
+        with self._lock(fcntl.LOCK_EX):
+            try:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return
+
+            skeletons = {}
+            records = {}
+            for line in data[:data.rfind(b'\n') + 1].splitlines(keepends=True):
+                op, _, rest = line.partition(b' ')
+                nid = rest.split(b' ', 1)[0].rstrip(b'\n')
+
+                if op == self.SKELETON:
+                    skeletons[nid] = line
+                elif op == self.CREATE:
+                    records[nid] = line
+                else:
+                    records.pop(nid, None)
+
+            with open(tmp_path, 'wb') as f:
+                # skeletons have to precede notifications referencing them
+                f.write(b''.join(skeletons.values()))
+                f.write(b''.join(records.values()))
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(tmp_path, self.path)
+
+        logger.debug("Journal '%s' compacted to %d records", self.path, len(records))
+
+
+class JournalStorageBackend(StorageBackend):
+    """Backend storing notifications in single append-only journal per storage directory"""
+    JOURNAL_NAME = 'notifications.journal'
+
+    def __init__(self, storage_dirs, plugin_storage):
+        super().__init__(storage_dirs, plugin_storage)
+
+        self.journals = {
+            name: Journal(os.path.join(path, self.JOURNAL_NAME)) for name, path in storage_dirs.items()
+        }
+
+    def _journal(self, n):
+        if n.persistent:
+            return self.journals['persistent']
+
+        return self.journals['volatile']
+
+    def save(self, n):
+        return self.save_many([n])
+
+    def save_many(self, notifications):
+        records = {}
+        skeletons = {}
+
+        for n in notifications:
+            journal = self._journal(n)
+            journal_records = records.setdefault(journal, [])
+            definition_hash = n.skeleton.get_reference()['hash']
+
+            if definition_hash not in journal.skeletons and (journal, definition_hash) not in skeletons:
+                definition = json.dumps(n.skeleton.serialize(), separators=(',', ':')).encode()
+                skeletons[(journal, definition_hash)] = definition
+                journal_records.append((Journal.SKELETON, definition_hash, definition))
+
+            journal_records.append((Journal.CREATE, n.notif_id, n.serialize().encode()))
+
+        try:
+            for journal, journal_records in records.items():
+                journal.append(journal_records)
+        except OSError:
+            logger.error("Error during writing notification to journal!")
+            return False
+
+        for (journal, definition_hash), definition in skeletons.items():
+            journal.skeletons[definition_hash] = definition
+
+        return True
+
+    def save_skeleton(self, skeleton):
+        # skeletons are written together with notifications in save_many()
+        return True
+
+    def load_skeleton(self, definition_hash):
+        for journal in self.journals.values():
+            if definition_hash in journal.skeletons:
+                return json.loads(journal.skeletons[definition_hash])
+
+        return None
+
+    def _remove(self, n, op):
+        try:
+            return self._journal(n).remove(n.notif_id, op)
+        except OSError as e:
+            logger.error("Cannot remove notification '%s' from journal. Reason: %s", n.notif_id, e)
+            return False
+
+    def delete(self, n):
+        return self._remove(n, Journal.DELETE)
+
+    def dismiss(self, n):
+        return self._remove(n, Journal.DISMISS)
+
+    def dismiss_many(self, notifications):
+        removed = set()
+        by_journal = {}
+
+        for n in notifications:
+            by_journal.setdefault(self._journal(n), []).append(n.notif_id)
+
+        for journal, nids in by_journal.items():
+            try:
+                removed |= journal.remove_many(nids, Journal.DISMISS)
+            except OSError as e:
+                logger.error("Cannot remove notifications from journal. Reason: %s", e)
+
+        return removed
+
+    def changes(self, known_ids):
+        added = []
+        removed = set()
+
+        # skeleton definitions might be in the other journal
+        for journal in self.journals.values():
+            journal.catch_up()
+
+        for journal in self.journals.values():
+            for nid, payload in journal.pop_pending().items():
+                if payload is None:
+                    removed.add(nid)
+                elif nid not in known_ids:
+                    n = self._load(journal, nid, payload)
+
+                    if n:
+                        added.append(n)
+
+        return added, removed
+
+    def _load(self, journal, nid, payload):
+        try:
+            return Notification.from_dict(json.loads(payload), self.plugin_storage, self.load_skeleton)
+        except json.JSONDecodeError as e:
+            logger.warning("Failed to deserialize journal record: %s", e)
+        except VersionMismatchError:
+            logger.debug("Notification version mismatch - deleting")
+            journal.remove(nid, Journal.DELETE)
+
+        return None
+
+    def compact(self):
+        """Compact all journals"""
+        for journal in self.journals.values():
+            journal.compact()
@@ -2,7 +2,7 @@
 
 import argparse
 
-from notifylib import Api
+from notifylib.client import connect
 from .severity import Severity
 
 
@@ -40,7 +40,7 @@ def process_args(parser, args):
         'severity': severity,
     }
 
-    api = Api()
+    api = connect()
     api.create(**opts)
 
 
@@ -2,7 +2,7 @@
 
 import argparse
 
-from . import Api
+from .client import connect
 
 
 def main():
@@ -11,11 +11,9 @@ def main():
 
     args = parser.parse_args()
 
-    api = Api()
+    api = connect()
 
-    for instance in args.ids:
-        nid = instance.split('-')[0]
-        api.call_action(nid, 'dismiss')
+    api.dismiss_many([instance.split('-')[0] for instance in args.ids])
 
 
 if __name__ == '__main__':
@@ -3,7 +3,7 @@
 import argparse
 import json
 
-from notifylib import Api
+from notifylib.client import connect
 from .severity import Severity
 
 
@@ -39,7 +39,7 @@ def main():
 
     args = parser.parse_args()
 
-    api = Api()
+    api = connect()
     notifications = api.get_notifications()
 
     print(reformat(notifications, indent=not args.n))
@@ -1,20 +1,17 @@
 import json
 import logging
+import sys
 import uuid
 
 from datetime import datetime
-from jinja2 import TemplateError
 from types import SimpleNamespace
 
-from .config import config
 from .exceptions import (
     CreateNotificationError,
     NoSuchTemplateError,
     NotificationTemplatingError,
     VersionMismatchError
 )
-from .notificationskeleton import NotificationSkeleton
-from .supervisor import Supervisor
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +20,19 @@ class Notification:
     ATTRS = ['notif_id', 'api_version', 'timestamp', 'skeleton', 'persistent', 'timeout', 'severity', 'data', 'fallback', 'valid', 'explicit_dismiss', 'default_action']
     # TODO: better name?
     META_ATTRS = ['persistent', 'timestamp', 'severity', 'default_action']
+    # attributes stored on disk, skeleton is stored only as reference
+    STORED_ATTRS = ['notif_id', 'api_version', 'timestamp', 'persistent', 'timeout', 'severity', 'data', 'fallback', 'valid', 'explicit_dismiss', 'default_action']
     API_VERSION = 1
+    # version 1 - whole skeleton serialized in every notification
+    # version 2 - compact json with reference to skeleton definition stored separately
+    FORMAT_VERSION = 2
+    SHORTID_LENGTH = 8
+
+    # thousands of instances may be kept in memory
+    __slots__ = [
+        'notif_id', 'api_version', 'timestamp', 'skeleton', 'persistent', 'timeout', 'severity', 'data',
+        '_fallback', 'fallback_source', 'valid', 'explicit_dismiss', 'default_action',
+    ]
 
     def __init__(self, notif_id, api_version, timestamp, skeleton, data, persistent, timeout, severity, fallback=None, valid=True, explicit_dismiss=True, default_action='dismiss'):
         self.notif_id = notif_id
@@ -32,71 +41,143 @@ class Notification:
 
         self.skeleton = skeleton
 
-        self.fallback = fallback
+        self._fallback = self._intern_keys(fallback)
+        # backend able to load fallback again once it is unloaded
+        self.fallback_source = None
         self.persistent = persistent
         self.timeout = timeout
-        self.severity = severity
+        self.severity = sys.intern(severity)
         self.explicit_dismiss = explicit_dismiss
 
         # default "closing" action
         # users will probably want to use "default" as simplest method to "just dismiss" notification
         if default_action in self.skeleton.actions:
-            self.default_action = default_action
+            self.default_action = sys.intern(default_action)
         else:
             self.default_action = 'dismiss'
 
         self.valid = valid
 
-        self.data = data
+        self.data = self._intern_keys(data)
+
+        if not self._fallback:
+            self._fallback = self.render_fallback_data()
+
+    @staticmethod
+    def _intern_keys(data):
+        """Keys of loaded dicts (media types, template variables) are the same in all notifications"""
+        if not isinstance(data, dict):
+            return data
+
+        return {sys.intern(k) if isinstance(k, str) else k: v for k, v in data.items()}
+
+    @property
+    def fallback(self):
+        """Messages rendered at creation, used when template can't be rendered"""
+        if self._fallback is None:
+            return self.fallback_source.load_fallback(self) or {}
+
+        return self._fallback
+
+    def unload_fallback(self, source):
+        """
+        Drop fallback from memory, it is loaded from `source` backend when needed
 
-        if not self.fallback:
-            self.fallback = self.render_fallback_data()
+        Fallback is rarely needed and it contains message in every media type
+        """
+        self.fallback_source = source
+        self._fallback = None
 
     @classmethod
     def new(cls, skel, **opts):
         """Generate mandatory params during creation and return new instance"""
         nid = cls._generate_id()
-        ts = int(datetime.utcnow().timestamp())
+        ts = cls.now()
 
         n = cls(nid, cls.API_VERSION, ts, skel, **opts)
 
         return n
 
     @classmethod
-    def from_file(cls, path, plugin_storage):
+    def from_file(cls, path, plugin_storage, skeleton_loader=None):
         """
         Load notification from it's file and return new instance
 
         If there is failure to open/deserialize i.e. get file, return None
         If there is invalid content, raise exception
         """
+        json_data = cls.read_file(path)
+        if json_data is None:
+            return None
+
+        return cls.from_dict(json_data, plugin_storage, skeleton_loader)
+
+    @staticmethod
+    def read_file(path):
+        """Return deserialized content of notification file or None if it can't be read"""
         try:
             with open(path, 'r') as f:
-                json_data = json.load(f)
+                return json.load(f)
         except FileNotFoundError:
             logger.warning("Failed to open notification file '%s'", path)
-            return None
         except json.JSONDecodeError as e:
             logger.warning("Failed to deserialize json file: %s", e)
-            return None
 
+        return None
+
+    @classmethod
+    def from_dict(cls, json_data, plugin_storage, skeleton_loader=None):
+        """
+        Create new instance from deserialized notification data
+
+        `skeleton_loader` is function returning stored skeleton definition by its hash,
+        it is needed for notifications in compact format.
+
+        If there is invalid content, raise exception
+        """
         # Very simple validation based on API version
         if not cls.validate_version(json_data):
             raise VersionMismatchError
 
+        fmt = json_data.pop('format', 1)
         skel_args = json_data['skeleton']
         plug = plugin_storage.get_plugin(skel_args['plugin_name'])
 
         if not plug:
             logger.warning("Plugin '%s' not available - check your instalation", skel_args['plugin_name'])
 
-        skel_args['jinja_env'] = plugin_storage.get_jinja_env()
+        if fmt == 1:
+            json_data['skeleton'] = cls._skeleton_from_definition(skel_args, plugin_storage)
+        else:
+            json_data['skeleton'] = cls._skeleton_from_reference(skel_args, plugin_storage, skeleton_loader)
 
+        return cls(**json_data)
+
+    @staticmethod
+    def _skeleton_from_definition(definition, plugin_storage, definition_hash=None):
         # TODO: Use json schema or another validation method
-        skel_obj = NotificationSkeleton(**skel_args)
-        json_data['skeleton'] = skel_obj  # replace json data with skeleton instance
+        return plugin_storage.intern_skeleton(definition, definition_hash)
 
-        return cls(**json_data)
+    @classmethod
+    def _skeleton_from_reference(cls, ref, plugin_storage, skeleton_loader):
+        """Find skeleton definition referenced by compact notification"""
+        skel = plugin_storage.find_skeleton(ref)
+        if skel:
+            return skel
+
+        skel = plugin_storage.get_skeleton('{}.{}'.format(ref['plugin_name'], ref['name']))
+
+        # skeleton from current plugin is the same one
+        if skel and skel.get_reference() == ref:
+            return skel
+
+        definition = skeleton_loader(ref['hash']) if skeleton_loader else None
+
+        if not definition:
+            logger.warning("Definition of skeleton '%s.%s' not found", ref['plugin_name'], ref['name'])
+            raise VersionMismatchError
+
+        return cls._skeleton_from_definition(definition, plugin_storage, ref['hash'])
 
     @classmethod
     def validate_version(cls, data):
@@ -115,24 +196,23 @@ class Notification:
 
         return True
 
-    def is_valid(self, timestamp=None):
-        """If notification is still valid based on multiple conditions"""
-        if not timestamp:
-            timestamp = int(datetime.utcnow().timestamp())
+    def expiry_time(self):
+        """
+        Return timestamp since which notification is no longer valid
 
+        Return None if notification never expires
+        """
         if not self.valid:
-            return False
+            return self.timestamp
 
         if self.timeout:
-            create_time = datetime.fromtimestamp(self.timestamp)
-            delta = timestamp - create_time
-
-            if delta.total_seconds() >= self.timeout:
-                return False
+            return self.timestamp + self.timeout
 
-        return True
+        return None
 
     def render_template(self, media_type, lang):
+        from jinja2 import TemplateError
+
         try:
             return self.skeleton.render(self.data, media_type, lang)
         except TemplateError:
@@ -153,10 +233,11 @@ class Notification:
             output['message'] = self.render_template(media_type, lang)
             return output
         except NotificationTemplatingError:
-            if media_type not in self.fallback:
-                output['message'] = self.fallback['plain']
+            fallback = self.fallback
+            if media_type not in fallback:
+                output['message'] = fallback.get('plain', '')
             else:
-                output['message'] = self.fallback[media_type]
+                output['message'] = fallback[media_type]
             return output
 
     def render_fallback_data(self):
@@ -186,9 +267,21 @@ class Notification:
 
         return out
 
-    def serialize(self):
-        """Return serialized data as json"""
-        return json.dumps(self._serialize_data(self.ATTRS), indent=4)
+    def serialize(self, fmt=FORMAT_VERSION):
+        """
+        Return serialized data as compact json in given format
+
+        In format 2 skeleton is stored only as reference, its definition has to be stored separately.
+        Format 1 embeds whole skeleton and it is readable by older versions.
+        """
+        if fmt == 1:
+            return json.dumps(self._serialize_data(self.ATTRS), separators=(',', ':'))
+
+        data = self._serialize_data(self.STORED_ATTRS)
+        data['format'] = self.FORMAT_VERSION
+        data['skeleton'] = self.skeleton.get_reference()
+
+        return json.dumps(data, separators=(',', ':'))
 
     def get_data(self):
         """Return instance content as SimpleNamespace"""
@@ -210,35 +303,25 @@ class Notification:
         self._dismiss()
         return True
 
-    def _run_cmd_standalone(self, cmd, cmd_args, timeout):
-        """
-        Run command in new standalone process
-
-        Process is supervised to control it's run a little bit
-        """
-        supervisor = Supervisor()
-        supervisor.run(cmd, cmd_args, timeout)
-
-    def call_action(self, name, plugin_skeleton, cmd_args=None, dry_run=True):
+    def get_action_to_run(self, name, plugin_skeleton):
+        """Return command of action if current version of plugin allows to run it, otherwise None"""
         action_cmd = self.skeleton.get_action_cmd(name)
 
         if not action_cmd:
-            logger.debug("Action '%s' not available", name)
-            return False
+            return None
 
-        if dry_run:
-            logger.debug("Dry run: executing command '%s'", action_cmd)
-        else:
-            if name not in plugin_skeleton.actions.keys():
-                logger.warning("Action is not presented in current version of plugin. Won't execute")
-            elif self.skeleton.version != plugin_skeleton.version:
-                logger.warning("Using outdated action. Won't execute")
-            else:
-                timeout = config.getint('settings', 'cmd_timeout')
-                self._run_cmd_standalone(action_cmd, cmd_args, timeout)
+        if not plugin_skeleton or name not in plugin_skeleton.actions.keys():
+            logger.warning("Action is not presented in current version of plugin. Won't execute")
+            return None
 
-        self._dismiss()
-        return True
+        if self.skeleton.version != plugin_skeleton.version:
+            logger.warning("Using outdated action. Won't execute")
+            return None
+
+        return action_cmd
+
+    def get_skeleton_id(self):
+        return '{}.{}'.format(self.skeleton.plugin_name, self.skeleton.name)
 
     def get_default_action(self):
         return self.default_action
@@ -254,6 +337,11 @@ class Notification:
     def has_media_type(self, media_type):
         return media_type in self.skeleton.get_media_types()
 
+    @staticmethod
+    def now():
+        """Return current time in the same form as notification timestamp"""
+        return int(datetime.utcnow().timestamp())
+
     @staticmethod
     def _generate_id():
         """
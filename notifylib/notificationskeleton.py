@@ -1,10 +1,9 @@
-import gettext
+import hashlib
+import json
 import logging
 import os
+import sys
 
-import yaml
-
-from jinja2 import TemplateNotFound
 from .exceptions import NoSuchTemplateError
 
 logger = logging.getLogger(__name__)
@@ -13,24 +12,29 @@ logger = logging.getLogger(__name__)
 class NotificationSkeleton:
     ATTRS = ['name', 'plugin_name', 'version', 'template', 'actions', 'timeout', 'severity', 'persistent', 'explicit_dismiss']
     DEFAULT_ATTRS = ['timeout', 'severity', 'persistent', 'explicit_dismiss']
+    # the same values as constructor defaults
+    DEFAULTS = {'timeout': None, 'severity': 'info', 'persistent': False, 'explicit_dismiss': True}
+
+    __slots__ = ATTRS + ['fallback', 'definition_hash', 'plugin_storage', 'jinja_env', 'jinja_message_template']
 
-    def __init__(self, name, plugin_name, version, template, actions, jinja_env, timeout=None, severity='info', persistent=False, explicit_dismiss=True):
-        self.name = name
-        self.plugin_name = plugin_name
+    def __init__(self, name, plugin_name, version, template, actions, plugin_storage, timeout=None, severity='info', persistent=False, explicit_dismiss=True):
+        self.name = sys.intern(name)
+        self.plugin_name = sys.intern(plugin_name)
         self.version = version
-        self.template = template
+        self.template = dict(template, supported_media=[sys.intern(mt) for mt in template['supported_media']])
         self.actions = actions
         self.timeout = timeout
-        self.severity = severity
+        self.severity = sys.intern(severity)
         self.persistent = persistent
         self.explicit_dismiss = explicit_dismiss
 
         self.fallback = False
-        self.jinja_env = jinja_env
+        self.definition_hash = None
+        self.plugin_storage = plugin_storage
+        self.jinja_env = plugin_storage.get_jinja_env()
+        self.jinja_message_template = None
         self.setup_jinja_env()
 
-        self.translations = {}
-
     def get_media_types(self):
         return self.template['supported_media']
 
@@ -42,6 +46,31 @@ class NotificationSkeleton:
 
         return json_data
 
+    def get_reference(self):
+        """
+        Return reference to this skeleton definition
+
+        Hash of definition distinguishes skeletons of the same name and version
+        with different content, e.g. created by modified plugin
+        """
+        if self.definition_hash is None:
+            self.definition_hash = self.hash_definition(self.serialize())
+
+        return {
+            'plugin_name': self.plugin_name,
+            'name': self.name,
+            'version': self.version,
+            'hash': self.definition_hash,
+        }
+
+    @classmethod
+    def hash_definition(cls, definition):
+        """Return hash of skeleton definition, missing optional attributes have default values"""
+        definition = dict(cls.DEFAULTS, **{attr: definition[attr] for attr in cls.ATTRS if attr in definition})
+        data = json.dumps(definition, sort_keys=True, separators=(',', ':'))
+
+        return hashlib.sha1(data.encode()).hexdigest()
+
     def get_skeleton_defaults(self):
         defaults = {}
 
@@ -60,46 +89,38 @@ class NotificationSkeleton:
         return None
 
     def translate_actions(self, lang):
-        self._set_jinja_translation(lang)
-
-        if self.fallback:
-            translated = []
+        titles = None
+        if not self.fallback:
+            titles = self.plugin_storage.get_action_titles(self.plugin_name, lang)
 
-            for action in self.actions.values():
-                tpl = self.jinja_env.from_string(action['title'])
-                action['title'] = tpl.render()
-                translated.append(action)
-
-            parsed = {'actions': translated}
-        else:
-            parsed = yaml.safe_load(self.jinja_plugin_template.render())
+        if titles is None:
+            # plugin is not available, translate titles stored in skeleton
+            translation = self.plugin_storage.get_translation_context(lang)
+            titles = {
+                name: self.jinja_env.from_string(action['title']).render(**translation) for name, action in self.actions.items()
+            }
 
         return {
-            pa['name']: pa['title'] for pa in parsed['actions'] if pa['name'] in self.actions
+            name: title for name, title in titles.items() if name in self.actions
         }
 
     def setup_jinja_env(self):
         """Prepare templates for later use"""
+        from jinja2 import TemplateNotFound
+
         try:
             self.jinja_message_template = self.jinja_env.get_template(os.path.join(self.plugin_name, 'templates', self.template['src']))
-
-            self.jinja_plugin_template = self.jinja_env.get_template(os.path.join(self.plugin_name, 'plugin.yml'))
         except TemplateNotFound as e:
             self.fallback = True
             logger.warning("Template file '%s' not found", e)
             logger.debug("Using fallback instead")
 
-    def _set_jinja_translation(self, lang):
-        self.jinja_env.install_gettext_translations(
-            gettext.translation("notification-system", localedir='/usr/share/locale', languages=[lang], fallback=True)
-        )
-
     def render(self, data, media_type, lang):
         """Render using jinja in given language"""
         if self.fallback:
             raise NoSuchTemplateError
 
-        self._set_jinja_translation(lang)
-        output = self.jinja_message_template.render(media=media_type, **data)
+        translation = self.plugin_storage.get_translation_context(lang)
+        output = self.jinja_message_template.render(dict(data, media=media_type, **translation))
 
         return output
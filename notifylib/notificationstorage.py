@@ -1,38 +1,96 @@
-import glob
-import os
+import bisect
+import heapq
+import importlib
+import functools
+import itertools
 import logging
+import threading
 
-from datetime import datetime
-from pathlib import Path
-
-from .exceptions import VersionMismatchError, NoSuchNotificationError
+from .events import EventLog
+from .exceptions import NoSuchNotificationError
 from .notification import Notification
+from .rendercache import RenderCache
+from .sorting import Sorting
 
 logger = logging.getLogger(__name__)
 
 
+def synchronized(method):
+    """Run method with storage lock held"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class NotificationStorage:
-    """In-memory notification storage that serialize and deserialize them"""
-    SHORTID_LENGTH = 8
+    """
+    In-memory notification storage that serialize and deserialize them
 
-    def __init__(self, volatile_dir, persistent_dir, plugin_storage):
+    Backend is created and synchronized on first access to notifications.
+    Public methods hold reentrant lock, so storage can be shared by threads
+    """
+    SHORTID_LENGTH = Notification.SHORTID_LENGTH
+
+    # backends are imported only when used
+    BACKENDS = {
+        'files': ('.storagebackend', 'FileStorageBackend'),
+        'journal': ('.journalbackend', 'JournalStorageBackend'),
+        'sqlite': ('.sqlitebackend', 'SqliteStorageBackend'),
+    }
+
+    SORT_KEYS = Sorting.NOTIFICATION_KEYS
+    EXPIRY_HEAP_SLACK = 256
+
+    def __init__(self, volatile_dir, persistent_dir, plugin_storage, backend='files', render_cache_size=1024):
         self.storage_dirs = {
             'persistent': persistent_dir,
             'volatile': volatile_dir,
         }
         self.plugin_storage = plugin_storage
 
+        self.lock = threading.RLock()
         self.notifications = {}
-        self.shortid_map = {}
 
-        self.paths = [
-            Path(self.storage_dirs['volatile']),
-            Path(self.storage_dirs['persistent']),
-        ]
+        # lookup indexes
+        # legacy timestamp -> ids in order of addition, the first one wins on collision
+        self.timestamp_index = {}
+        # sorted ids for lookup by unique prefix (short id) of any length
+        self.sorted_ids = []
+        # (sort key, id) pairs in ascending order for every sort criterion
+        self.sorted_views = {criterion: [] for criterion in self.SORT_KEYS}
+        # min-heap of (expiry time, id), entries of removed notifications are dropped lazily
+        self.expiry_heap = []
 
-        self.latest_sync = [0 for _ in self.paths]
-        self.sync()
+        self.events = EventLog(self._query_metadata)
+        self.render_cache = RenderCache(render_cache_size)
+        self.render_generation = plugin_storage.generation
 
+        if backend not in self.BACKENDS:
+            raise ValueError("Unknown storage backend '{}'".format(backend))
+
+        self.backend_name = backend
+        self._backend = None
+
+    @property
+    @synchronized
+    def backend(self):
+        if self._backend is None:
+            module_name, class_name = self.BACKENDS[self.backend_name]
+
+            try:
+                module = importlib.import_module(module_name, __package__)
+            except ImportError as e:
+                # e.g. sqlite3 module is optional
+                raise ValueError("Storage backend '{}' is not available: {}".format(self.backend_name, e))
+
+            self._backend = getattr(module, class_name)(self.storage_dirs, self.plugin_storage)
+
+        return self._backend
+
+    @synchronized
     def store(self, n):
         """
         Store in memory
@@ -40,85 +98,96 @@ class NotificationStorage:
         Serializate to disk
         Render fallback in default languages
         """
-        self.notifications[n.notif_id] = n
-        self.shortid_map[n.notif_id[:self.SHORTID_LENGTH]] = n.notif_id
-
-        if n.persistent:
-            storage_dir = self.storage_dirs['persistent']
-        else:
-            storage_dir = self.storage_dirs['volatile']
+        # nothing is cached or announced unless it was persisted
+        if not self.backend.save(n):
+            return False
 
-        # save to disk
-        file_path = os.path.join(storage_dir, "{}.json".format(n.notif_id))
+        self.load_new(n)
+        self._unload_fallback(n)
+        return True
 
-        try:
-            with open(file_path, 'w') as f:
-                f.write(n.serialize())
-        except OSError:
-            logger.error("Error during writing notification to disk!")
+    @synchronized
+    def store_many(self, notifications):
+        """Store multiple notifications in memory and serialize them to backend at once"""
+        if not self.backend.save_many(notifications):
             return False
 
+        for n in notifications:
+            self.load_new(n)
+            self._unload_fallback(n)
+
         return True
 
-    def load_new(self, pathstr):
-        """Try to load new notification from file"""
-        n = Notification.from_file(pathstr, self.plugin_storage)
+    def _unload_fallback(self, n):
+        """Keep fallback of stored notification only on disk if backend can load it again"""
+        if self.backend.supports_fallback_loading:
+            n.unload_fallback(self.backend)
+
+    def load_new(self, n):
+        """Add notification loaded from backend to in-memory cache"""
+        replaced = n.notif_id in self.notifications
+        if replaced:
+            self._delete_from_memory(n.notif_id, None)
+
+        self.notifications[n.notif_id] = n
 
-        if n:
-            self.notifications[n.notif_id] = n
-            self.shortid_map[n.notif_id[:self.SHORTID_LENGTH]] = n.notif_id
+        self.timestamp_index.setdefault(n.timestamp, []).append(n.notif_id)
+        bisect.insort(self.sorted_ids, n.notif_id)
 
-    def _delete_from_memory(self, nid):
+        for criterion, view in self.sorted_views.items():
+            bisect.insort(view, (self.SORT_KEYS[criterion](n), n.notif_id))
+
+        expiry = n.expiry_time()
+        if expiry is not None:
+            heapq.heappush(self.expiry_heap, (expiry, n.notif_id))
+
+        if not replaced:
+            self.events.emit(EventLog.CREATED, n)
+
+    def _delete_from_memory(self, nid, event=EventLog.DISMISSED):
         """Remove notification that no longer exist on fs from in-memory cache."""
-        del self.notifications[nid]
-        del self.shortid_map[nid[:self.SHORTID_LENGTH]]
+        n = self.notifications.pop(nid)
+
+        same_ts = self.timestamp_index[n.timestamp]
+        same_ts.remove(nid)
+        if not same_ts:
+            del self.timestamp_index[n.timestamp]
+
+        i = bisect.bisect_left(self.sorted_ids, nid)
+        del self.sorted_ids[i]
+
+        for criterion, view in self.sorted_views.items():
+            i = bisect.bisect_left(view, (self.SORT_KEYS[criterion](n), nid))
+            del view[i]
+
+        self.render_cache.invalidate(nid)
 
-    def _update_notifications_from_fs(self):
-        """Check for changes on hdd. Load new notifications
+        if len(self.expiry_heap) > self.EXPIRY_HEAP_SLACK + 2 * len(self.notifications):
+            # too many stale entries of notifications removed before expiry
+            self.expiry_heap = [(expiry, i) for expiry, i in self.expiry_heap if i in self.notifications]
+            heapq.heapify(self.expiry_heap)
+
+        if event:
+            self.events.emit(event, n)
+
+    def _update_notifications_from_backend(self):
+        """Check for changes in backend. Load new notifications
         Drop these that no longer exist.
         """
-        if all(p.stat().st_mtime == l for p, l in zip(self.paths, self.latest_sync)):
-                # nothing changed, we are in sync
-                return
-
-        notification_ids = {} 
-
-        for path in self.paths:
-            for p in path.glob('*.json'):
-                notification_ids[p.stem] = p 
-                
-        # delete notifications than doesn't exits on fs anymore
-        to_delete = self.notifications.keys() - notification_ids.keys()
-        for nid in to_delete:
-            self._delete_from_memory(nid)
-        
-        # load new notifications from fs
-        to_delete_invalid = []
-        to_add = notification_ids.keys() - self.notifications.keys()
-        for nid in to_add:
-            filepath = str(notification_ids[nid])
-            try:
-                self.load_new(filepath)
-            except FileNotFoundError:
-                continue
-            except VersionMismatchError:
-                logger.debug("Notification version mismatch - marking to delete")
-                to_delete_invalid.append(filepath)
-                continue
-        
-        # delete invalid notifications from fs
-        for path in to_delete_invalid:
-            self.remove_file(path)
+        added, removed = self.backend.changes(self.notifications.keys())
+
+        for nid in removed:
+            if nid in self.notifications:
+                self._delete_from_memory(nid)
 
+        for n in added:
+            self._unload_fallback(n)
+            self.load_new(n)
+
+    @synchronized
     def valid_id(self, msgid):
         """Check if msgid is valid and message with that id exists"""
-        # legacy compatibility
-        # lookup by timestamp
-        for nid, n in self.notifications.items():
-            if msgid.isnumeric() and n.timestamp == int(msgid):
-                return True
-
-        if msgid not in self.notifications and msgid not in self.shortid_map:
+        if self._full_id(msgid) is None:
             logger.debug("Notification ID '%s' does not exist", msgid)
             return False
 
@@ -126,57 +195,107 @@ class NotificationStorage:
 
     def _full_id(self, msgid):
         """
-        Get full id of notification based on short id.
-        Expects existing id.
+        Get full id of notification based on full id, legacy timestamp or short id.
+
+        Short id is any unique prefix of full id.
+        Return None if there is no such notification.
         """
+        if msgid in self.notifications:
+            return msgid
+
         # legacy compatibility
         # lookup by timestamp
-        for nid, n in self.notifications.items():
-            if msgid.isnumeric() and n.timestamp == int(msgid):
-                return nid
+        if msgid.isnumeric():
+            same_ts = self.timestamp_index.get(int(msgid))
+            if same_ts:
+                return same_ts[0]
 
-        if len(msgid) == self.SHORTID_LENGTH:
-            return self.shortid_map[msgid]
+        if not msgid:
+            return None
+
+        i = bisect.bisect_left(self.sorted_ids, msgid)
+        if i == len(self.sorted_ids) or not self.sorted_ids[i].startswith(msgid):
+            return None
 
-        return msgid
+        if i + 1 < len(self.sorted_ids) and self.sorted_ids[i + 1].startswith(msgid):
+            logger.debug("Short ID '%s' is ambiguous", msgid)
+            return None
 
+        return self.sorted_ids[i]
+
+    @synchronized
     def get(self, msgid):
         """Return single notification instance"""
         self.sync()
 
-        if self.valid_id(msgid):
-            msgid = self._full_id(msgid)
-
+        msgid = self._full_id(msgid)
+        if msgid:
             return self.notifications[msgid]
 
         return None
 
+    @synchronized
+    def get_many(self, msgids):
+        """
+        Return notification instances of multiple ids after single sync
+
+        Ids which don't exist are mapped to None
+        """
+        self.sync()
+
+        result = {}
+        for msgid in msgids:
+            nid = self._full_id(msgid)
+            result[msgid] = self.notifications[nid] if nid else None
+
+        return result
+
     def _get_rendered(self, msgid, media_type, lang, force_media_type=False):
         """Return notification either cached or if missing, cache it and return"""
-        msgid = self._full_id(msgid)
         n = self.notifications[msgid]
 
         mt = n.has_media_type(media_type)
         if not mt and force_media_type:
             return None
 
-        return n.render(media_type, lang)
+        if self.plugin_storage.generation != self.render_generation:
+            # plugins were reloaded, translations and templates might differ
+            self.render_cache.clear()
+            self.render_generation = self.plugin_storage.generation
+
+        key = (msgid, media_type, lang, n.skeleton.version)
+        rendered = self.render_cache.get(key)
+
+        if rendered is None:
+            rendered = n.render(media_type, lang)
+            self.render_cache.put(key, rendered)
+
+        # callers are free to modify returned data
+        return {
+            'actions': dict(rendered['actions']),
+            'metadata': dict(rendered['metadata']),
+            'message': rendered['message'],
+        }
 
+    @synchronized
     def get_rendered(self, msgid, media_type, lang, force_media_type=False):
         """Get single notification rendered."""
         self.sync()
 
-        if not self.valid_id(msgid):
+        nid = self._full_id(msgid)
+        if not nid:
             raise NoSuchNotificationError("Notification with ID '{}' does not exist".format(msgid))
 
-        return self._get_rendered(msgid, media_type, lang, force_media_type)
+        return self._get_rendered(nid, media_type, lang, force_media_type)
 
+    @synchronized
     def get_all(self):
         """Get all stored notification objects"""
         self.sync()
 
-        return self.notifications
+        return dict(self.notifications)
 
+    @synchronized
     def get_all_rendered(self, media_type, lang):
         """Get all notifications rendered in lang and in given media_type"""
         self.sync()
@@ -188,67 +307,186 @@ class NotificationStorage:
 
         return notifications
 
+    @staticmethod
+    def _query_metadata(n):
+        return {
+            'id': n.notif_id,
+            'short_id': n.notif_id[:Notification.SHORTID_LENGTH],
+            'timestamp': n.timestamp,
+            'severity': n.severity,
+            'persistent': n.persistent,
+            'timeout': n.timeout,
+            'skeleton_id': n.get_skeleton_id(),
+        }
+
+    def _ordered(self, sort, since=None):
+        """
+        Iterate over notifications from the newest (or the most severe) one using sorted view
+
+        Notifications older than `since` are skipped without visiting them when sorting by timestamp
+        """
+        view = self.sorted_views[sort]
+        lo = 0
+
+        if sort == 'timestamp' and since is not None:
+            lo = bisect.bisect_left(view, (since,))
+
+        for i in range(len(view) - 1, lo - 1, -1):
+            yield self.notifications[view[i][1]]
+
+    def _filter(self, notifications, severity, persistent, since):
+        for n in notifications:
+            if severity and n.severity not in severity:
+                continue
+            if persistent is not None and bool(n.persistent) != bool(persistent):
+                continue
+            if since is not None and n.timestamp < since:
+                continue
+
+            yield n
+
+    def _select(self, severity=None, persistent=None, since=None, sort=None, limit=None, offset=0):
+        """
+        Return notification instances matching filters
+
+        Notifications are sorted newest (or most severe) first,
+        without `sort` they are kept in storage order
+        """
+        end = None if limit is None else offset + limit
+
+        if self.backend.supports_query and sort:
+            ids = [m['id'] for m in self.backend.query(severity, persistent, since, sort, limit, offset)]
+            self.sync()
+
+            return [self.notifications[nid] for nid in ids if nid in self.notifications]
+
+        self.sync()
+
+        if sort:
+            ordered = self._ordered(sort, since)
+        else:
+            ordered = self.notifications.values()
+
+        matching = self._filter(ordered, severity, persistent, since)
+
+        return list(itertools.islice(matching, offset, end))
+
+    @synchronized
+    def get_rendered_page(self, media_type, lang, severity=None, persistent=None, since=None, sort=None, limit=None, offset=0):
+        """Render only notifications matching filters on requested page"""
+        notifications = {}
+
+        for n in self._select(severity, persistent, since, sort, limit, offset):
+            notifications[n.notif_id] = self._get_rendered(n.notif_id, media_type, lang)
+
+        return notifications
+
+    @synchronized
+    def query(self, severity=None, persistent=None, since=None, sort='timestamp', limit=None, offset=0):
+        """
+        Return metadata of notifications matching filters
+
+        Newest notifications (or most severe ones) come first
+        """
+        if self.backend.supports_query:
+            return self.backend.query(severity, persistent, since, sort, limit, offset)
+
+        return [self._query_metadata(n) for n in self._select(severity, persistent, since, sort, limit, offset)]
+
+    @synchronized
+    def count(self, severity=None, persistent=None, since=None):
+        """Return number of notifications matching filters"""
+        if self.backend.supports_query:
+            return self.backend.count(severity, persistent, since)
+
+        self.sync()
+
+        return sum(1 for _ in self._filter(self.notifications.values(), severity, persistent, since))
+
+    @synchronized
+    def changes_since(self, seq):
+        """Return events newer than given sequence number after sync"""
+        self.sync()
+
+        return self.events.since(seq)
+
+    @synchronized
     def sync(self):
         """
         Sync in-memory notifications with state on hdd.
         Delete old notifications and get new.
         """
         self._delete_invalid_messages()
-        self._update_notifications_from_fs()
-        
-        self.latest_sync = [path.stat().st_mtime for path in self.paths]
+        self._update_notifications_from_backend()
 
     def _delete_invalid_messages(self):
         """Delete messages based on their timeout"""
-        to_delete = []
-        now = datetime.utcnow()
+        now = Notification.now()
+
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            _, nid = heapq.heappop(self.expiry_heap)
 
-        for n in self.notifications.values():
-            if not n.is_valid(now):
-                to_delete.append(n)
+            if nid in self.notifications:
+                logger.debug("Deleting notification '%s' due to timeout", nid)
+                self.remove(nid, EventLog.EXPIRED)
 
-        for n in to_delete:
-            logger.debug("Deleting notification '%s' due to timeout", n.notif_id)
-            self.remove(n.notif_id)
+    @synchronized
+    def next_expiry(self):
+        """Return timestamp of the nearest expiry of stored notification or None"""
+        self.sync()
+
+        while self.expiry_heap and self.expiry_heap[0][1] not in self.notifications:
+            heapq.heappop(self.expiry_heap)
 
-    def remove(self, msgid):
+        if self.expiry_heap:
+            return self.expiry_heap[0][0]
+
+        return None
+
+    @synchronized
+    def remove(self, msgid, event=EventLog.DISMISSED):
         """
         Completely remove notification.
-        Order of removal is important - remove file first and then instance in cache.
+        Order of removal is important - remove from backend first and then instance in cache.
         """
-        self.remove_from_fs(msgid)
-        self.remove_from_cache(msgid)
+        msgid = self._full_id(msgid)
+        if msgid:
+            self.backend.delete(self.notifications[msgid])
+            self.remove_from_cache(msgid, event)
 
-    def remove_from_cache(self, msgid):
+    @synchronized
+    def remove_from_cache(self, msgid, event=EventLog.DISMISSED):
         """Remove single notification from in-memory cache"""
-        if self.valid_id(msgid):
-            msgid = self._full_id(msgid)
-
-            del self.notifications[msgid]
-            del self.shortid_map[msgid[:self.SHORTID_LENGTH]]
+        msgid = self._full_id(msgid)
+        if msgid:
+            self._delete_from_memory(msgid, event)
 
             logger.debug("Dismissing notification '%s'", msgid)
 
+    @synchronized
     def remove_from_fs(self, msgid):
-        """Remove single notification file from FS"""
-        if self.valid_id(msgid):
-            msgid = self._full_id(msgid)
-            n = self.notifications[msgid]
-
-            if n.persistent:
-                storage_dir = self.storage_dirs['persistent']
-            else:
-                storage_dir = self.storage_dirs['volatile']
-
-            filepath = os.path.join(storage_dir, "{}.json".format(msgid))
-            self._remove_file(filepath)
-
-    def _remove_file(self, filepath):
-        """Remove file from FS"""
-        logger.debug("Removing file %s", filepath)
-
-        try:
-            os.unlink(filepath)
-        except OSError as e:
-            logger.error("Cannot remove file '%s'. Reason: %s", filepath, e)
-            return
+        """
+        Dismiss single notification in backend
+
+        Return True if notification was removed by this call
+        """
+        msgid = self._full_id(msgid)
+        if msgid:
+            return self.backend.dismiss(self.notifications[msgid])
+
+        return False
+
+    @synchronized
+    def remove_many(self, notifications):
+        """
+        Dismiss multiple notifications in backend and remove them from in-memory cache
+
+        Return set of ids removed from backend by this call
+        """
+        removed = self.backend.dismiss_many(notifications)
+
+        for n in notifications:
+            if n.notif_id in self.notifications:
+                self._delete_from_memory(n.notif_id)
+
+        return removed
@@ -1,8 +1,6 @@
 import logging
 import pathlib
 
-import yaml
-
 logger = logging.getLogger(__name__)
 
 
@@ -31,6 +29,8 @@ class Plugin:
 
     @classmethod
     def from_file(cls, filepath):
+        import yaml
+
         try:
             with open(filepath, 'r') as f:
                 data = yaml.safe_load(f)
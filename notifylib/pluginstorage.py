@@ -1,7 +1,8 @@
+import gettext
 import glob
 import os
+import stat
 import logging
-import jinja2
 
 from functools import lru_cache
 
@@ -12,34 +13,134 @@ logger = logging.getLogger(__name__)
 
 
 class PluginStorage:
-    """Storage for plugins"""
+    """
+    Storage for plugins
+
+    Plugins and jinja environment are initialized on first use,
+    so short-lived processes pay only for what they need.
+    """
     META_ATTRS = ['name', 'version', 'timeout', 'severity', 'persistent', 'explicit_dismiss']
+    TRANSLATION_DOMAIN = 'notification-system'
+    LOCALE_DIR = '/usr/share/locale'
 
-    def __init__(self, plugin_dir):
+    def __init__(self, plugin_dir, bytecode_cache_dir=None):
         self.plugin_dir = plugin_dir
-        self.plugins = {}
-
-        self.load()
-        self.init_jinja_env()
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self._plugins = None
+        self._jinja_env = None
+        self.translations = {}
+        # compiled action title templates per plugin
+        self.action_title_templates = {}
+        # translated action titles per (plugin, lang)
+        self.action_titles = {}
+        # incremented on every reload so derived data can be invalidated
+        self.generation = 0
+        # skeleton instances by (plugin name, name, version, definition hash)
+        # shared by plugin skeletons and all notifications loaded from disk
+        self.skeletons = {}
+
+    @property
+    def plugins(self):
+        if self._plugins is None:
+            self.load()
+
+        return self._plugins
+
+    @property
+    def jinja_env(self):
+        if self._jinja_env is None:
+            self.init_jinja_env()
+
+        return self._jinja_env
 
     def load(self):
         """Load plugins from FS"""
+        plugins = {}
+
         for filepath in glob.glob(os.path.join(self.plugin_dir, '*', 'plugin.yml')):
             logger.debug("reading plugin file '%s'", filepath)
             p = Plugin.from_file(filepath)
 
             if p:
                 logger.debug("Reading plugin '%s'", p.name)
-                self.plugins[p.name] = p
+                plugins[p.name] = p
+
+        # other threads never see partially loaded plugins
+        self._plugins = plugins
+
+    def reload(self):
+        """Reload plugins from FS and drop everything derived from previous version"""
+        self.translations = {}
+        self.action_title_templates = {}
+        self.action_titles = {}
+        self.skeletons = {}
+        self.load()
+
+        self.get_skeleton.cache_clear()
+        self.generation += 1
+
+    def init_bytecode_cache(self):
+        """Return on-disk cache of compiled templates or None if it is disabled"""
+        if not self.bytecode_cache_dir:
+            return None
+
+        try:
+            os.makedirs(self.bytecode_cache_dir, mode=0o700, exist_ok=True)
+            st = os.lstat(self.bytecode_cache_dir)
+        except OSError as e:
+            logger.warning("Cannot create bytecode cache directory '%s': %s", self.bytecode_cache_dir, e)
+            return None
+
+        # compiled code is loaded from cache, so nobody else may be able to write there
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+            logger.warning("Bytecode cache directory '%s' is not private directory of current user, cache disabled", self.bytecode_cache_dir)
+            return None
+
+        from .bytecodecache import MtimeBytecodeCache
+
+        return MtimeBytecodeCache(self.bytecode_cache_dir)
 
     def init_jinja_env(self):
+        import jinja2
+
         template_loader = jinja2.FileSystemLoader(self.plugin_dir)
-        self.jinja_env = jinja2.Environment(
+        self._jinja_env = jinja2.Environment(
             loader=template_loader,
             autoescape=True,
-            extensions=['jinja2.ext.i18n']
+            extensions=['jinja2.ext.i18n'],
+            bytecode_cache=self.init_bytecode_cache(),
         )
 
+    def precompile_templates(self):
+        """
+        Compile all plugin templates into bytecode cache
+
+        Stale cached templates are dropped first
+        Return names of compiled templates
+        """
+        from jinja2 import TemplateError
+
+        bytecode_cache = self.jinja_env.bytecode_cache
+        if not bytecode_cache:
+            return []
+
+        bytecode_cache.clear()
+        compiled = []
+
+        for name, plugin in self.plugins.items():
+            for template in plugin.get_templates().values():
+                template_name = os.path.join(name, 'templates', template['src'])
+
+                try:
+                    self.jinja_env.get_template(template_name)
+                except TemplateError as e:
+                    logger.warning("Failed to compile template '%s': %s", template_name, e)
+                    continue
+
+                compiled.append(template_name)
+
+        return compiled
+
     def get_plugin(self, name):
         """Return plugin specified by name"""
         return self.plugins.get(name)
@@ -101,9 +202,32 @@ class PluginStorage:
             if attr in skeleton:
                 notification_args[attr] = skeleton[attr]
 
-        notification_args['jinja_env'] = self.jinja_env
+        return self.intern_skeleton(notification_args)
+
+    def intern_skeleton(self, definition, definition_hash=None):
+        """
+        Return skeleton instance of given definition
+
+        Skeleton is created only if the same definition wasn't seen before,
+        `definition_hash` can be passed if caller already knows it
+        """
+        if definition_hash is None:
+            definition_hash = NotificationSkeleton.hash_definition(definition)
 
-        return NotificationSkeleton(**notification_args)
+        key = (definition.get('plugin_name'), definition.get('name'), definition.get('version'), definition_hash)
+
+        skeleton = self.skeletons.get(key)
+        if skeleton is None:
+            skeleton = NotificationSkeleton(plugin_storage=self, **definition)
+            skeleton.definition_hash = definition_hash
+            # another thread might have been faster
+            skeleton = self.skeletons.setdefault(key, skeleton)
+
+        return skeleton
+
+    def find_skeleton(self, ref):
+        """Return already known skeleton instance of given reference or None"""
+        return self.skeletons.get((ref['plugin_name'], ref['name'], ref['version'], ref['hash']))
 
     def get_notification_types(self):
         """Return all notification types from plugins"""
@@ -123,3 +247,51 @@ class PluginStorage:
 
     def get_jinja_env(self):
         return self.jinja_env
+
+    def get_translation(self, lang):
+        """Return translation catalog of given language, load it on first use"""
+        if lang not in self.translations:
+            self.translations[lang] = gettext.translation(
+                self.TRANSLATION_DOMAIN, localedir=self.LOCALE_DIR, languages=[lang], fallback=True
+            )
+
+        return self.translations[lang]
+
+    def get_action_titles(self, plugin_name, lang):
+        """
+        Return titles of plugin actions translated to given language
+
+        Return None if plugin is not available
+        """
+        key = (plugin_name, lang)
+
+        if key not in self.action_titles:
+            plugin = self.get_plugin(plugin_name)
+            if not plugin:
+                return None
+
+            if plugin_name not in self.action_title_templates:
+                self.action_title_templates[plugin_name] = {
+                    name: self.jinja_env.from_string(action['title']) for name, action in plugin.get_actions().items()
+                }
+
+            translation = self.get_translation_context(lang)
+            self.action_titles[key] = {
+                name: tpl.render(**translation) for name, tpl in self.action_title_templates[plugin_name].items()
+            }
+
+        return self.action_titles[key]
+
+    def get_translation_context(self, lang):
+        """
+        Return gettext functions for jinja i18n extension
+
+        Passing them to `render()` translates template into given language
+        without installing translations globally to shared jinja env
+        """
+        translation = self.get_translation(lang)
+
+        return {
+            'gettext': translation.gettext,
+            'ngettext': translation.ngettext,
+        }
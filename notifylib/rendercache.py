@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+
+class RenderCache:
+    """
+    Bounded LRU cache of rendered notifications
+
+    Keys are tuples starting with notification id, so all entries
+    of single notification can be invalidated at once.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.keys_by_id = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return cached value or None"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        if key not in self.entries:
+            self.keys_by_id.setdefault(key[0], set()).add(key)
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            old_key, _ = self.entries.popitem(last=False)
+            self._forget_key(old_key)
+
+    def _forget_key(self, key):
+        keys = self.keys_by_id[key[0]]
+        keys.discard(key)
+
+        if not keys:
+            del self.keys_by_id[key[0]]
+
+    def invalidate(self, nid):
+        """Drop all cached entries of single notification"""
+        for key in self.keys_by_id.pop(nid, ()):
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+        self.keys_by_id.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+        }
@@ -1,4 +1,5 @@
 import logging
+import warnings
 
 from .severity import Severity
 
@@ -28,6 +29,16 @@ class Sorting:
 
     @staticmethod
     def sort_by(notifications, criterion, reverse=None):
+        """
+        Sort rendered notifications
+
+        Deprecated, use `Api.get_notifications(sort=criterion)` which sorts notifications before rendering
+        """
+        warnings.warn(
+            "Sorting.sort_by() is deprecated, use Api.get_notifications(sort=...) instead",
+            DeprecationWarning, stacklevel=2
+        )
+
         if criterion in Sorting.SORT_ARGS:
             key_func, default_reverse = Sorting.SORT_ARGS[criterion]
 
@@ -46,3 +57,17 @@ class Sorting:
         'severity': [by_severity.__func__, True],
         'timestamp': [by_timestamp.__func__, True]
     }
+
+    @staticmethod
+    def notification_by_timestamp(n):
+        return n.timestamp
+
+    @staticmethod
+    def notification_by_severity(n):
+        return (Sorting.SEVERITY_RANK.get(n.severity, 0), n.timestamp)
+
+    # criterion: key function of notification instance
+    NOTIFICATION_KEYS = {
+        'severity': notification_by_severity.__func__,
+        'timestamp': notification_by_timestamp.__func__,
+    }
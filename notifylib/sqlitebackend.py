@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import sqlite3
+
+from .exceptions import VersionMismatchError
+from .notification import Notification
+from .sorting import Sorting
+from .storagebackend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteStorageBackend(StorageBackend):
+    """
+    Backend storing notifications in SQLite database
+
+    Metadata are stored in indexed columns, so notifications can be queried
+    without deserializing them. Persistent notifications are stored in database
+    in persistent directory, volatile ones in database attached from volatile directory.
+    """
+    DB_NAME = 'notifications.sqlite'
+    SCHEMAS = {'persistent': 'main', 'volatile': 'volatile'}
+
+    COLUMNS = ['id', 'short_id', 'timestamp', 'severity', 'severity_rank', 'persistent', 'timeout', 'skeleton_id', 'payload']
+    META_COLUMNS = ['id', 'short_id', 'timestamp', 'severity', 'persistent', 'timeout', 'skeleton_id']
+
+    ORDER_BY = {
+        'timestamp': 'timestamp DESC, id DESC',
+        'severity': 'severity_rank DESC, timestamp DESC, id DESC',
+    }
+
+    # stay below default SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions
+    CHUNK_SIZE = 500
+
+    supports_query = True
+    supports_fallback_loading = True
+
+    def __init__(self, storage_dirs, plugin_storage):
+        super().__init__(storage_dirs, plugin_storage)
+
+        # connection is shared by threads, NotificationStorage serializes access to it
+        self.conn = sqlite3.connect(
+            os.path.join(storage_dirs['persistent'], self.DB_NAME), timeout=10, check_same_thread=False
+        )
+        self.conn.execute("ATTACH DATABASE ? AS volatile", (os.path.join(storage_dirs['volatile'], self.DB_NAME),))
+
+        for schema in self.SCHEMAS.values():
+            self._create_schema(schema)
+
+        self.data_version = None
+        self.saved_skeletons = set()
+
+    def _create_schema(self, schema):
+        self.conn.execute("PRAGMA {}.journal_mode=WAL".format(schema))
+
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS {}.notifications (
+                    id TEXT PRIMARY KEY,
+                    short_id TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL,
+                    severity TEXT NOT NULL,
+                    severity_rank INTEGER NOT NULL,
+                    persistent INTEGER NOT NULL,
+                    timeout INTEGER,
+                    skeleton_id TEXT NOT NULL,
+                    payload BLOB NOT NULL
+                )
+            """.format(schema))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS {}.notifications_short_id ON notifications (short_id)".format(schema))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS {}.notifications_timestamp ON notifications (timestamp)".format(schema))
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS {}.notifications_severity ON notifications (severity_rank, timestamp)".format(schema)
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS {}.skeletons (
+                    hash TEXT PRIMARY KEY,
+                    definition BLOB NOT NULL
+                )
+            """.format(schema))
+
+    def _schema(self, n):
+        if n.persistent:
+            return self.SCHEMAS['persistent']
+
+        return self.SCHEMAS['volatile']
+
+    def _row(self, n):
+        return (
+            n.notif_id,
+            n.notif_id[:Notification.SHORTID_LENGTH],
+            n.timestamp,
+            n.severity,
+            Sorting.SEVERITY_RANK.get(n.severity, 0),
+            int(bool(n.persistent)),
+            n.timeout,
+            n.get_skeleton_id(),
+            n.serialize().encode(),
+        )
+
+    def save(self, n):
+        return self.save_many([n])
+
+    def save_many(self, notifications):
+        query = "INSERT OR REPLACE INTO {}.notifications ({}) VALUES ({})"
+
+        try:
+            with self.conn:
+                for n in notifications:
+                    self._save_skeleton(self._schema(n), n.skeleton)
+                    self.conn.execute(
+                        query.format(self._schema(n), ', '.join(self.COLUMNS), ', '.join('?' * len(self.COLUMNS))),
+                        self._row(n)
+                    )
+        except sqlite3.Error as e:
+            logger.error("Error during writing notification to database: %s", e)
+            return False
+
+        return True
+
+    def _save_skeleton(self, schema, skeleton):
+        definition_hash = skeleton.get_reference()['hash']
+        if (schema, definition_hash) in self.saved_skeletons:
+            return
+
+        self.conn.execute(
+            "INSERT OR IGNORE INTO {}.skeletons (hash, definition) VALUES (?, ?)".format(schema),
+            (definition_hash, json.dumps(skeleton.serialize(), separators=(',', ':')).encode())
+        )
+        self.saved_skeletons.add((schema, definition_hash))
+
+    def save_skeleton(self, skeleton):
+        # skeletons are written together with notifications in save_many()
+        return True
+
+    def load_skeleton(self, definition_hash):
+        for schema in self.SCHEMAS.values():
+            row = self.conn.execute(
+                "SELECT definition FROM {}.skeletons WHERE hash = ?".format(schema), (definition_hash,)
+            ).fetchone()
+
+            if row:
+                return json.loads(row[0])
+
+        return None
+
+    def load_fallback(self, n):
+        row = self.conn.execute(
+            "SELECT payload FROM {}.notifications WHERE id = ?".format(self._schema(n)), (n.notif_id,)
+        ).fetchone()
+
+        return json.loads(row[0]).get('fallback') if row else None
+
+    def delete(self, n):
+        try:
+            with self.conn:
+                cur = self.conn.execute("DELETE FROM {}.notifications WHERE id = ?".format(self._schema(n)), (n.notif_id,))
+        except sqlite3.Error as e:
+            logger.error("Cannot remove notification '%s' from database. Reason: %s", n.notif_id, e)
+            return False
+
+        return cur.rowcount > 0
+
+    def dismiss_many(self, notifications):
+        removed = set()
+
+        try:
+            with self.conn:
+                for n in notifications:
+                    cur = self.conn.execute("DELETE FROM {}.notifications WHERE id = ?".format(self._schema(n)), (n.notif_id,))
+
+                    if cur.rowcount > 0:
+                        removed.add(n.notif_id)
+        except sqlite3.Error as e:
+            logger.error("Cannot remove notifications from database. Reason: %s", e)
+            return set()
+
+        return removed
+
+    def _get_data_version(self):
+        return tuple(
+            self.conn.execute("PRAGMA {}.data_version".format(schema)).fetchone()[0] for schema in self.SCHEMAS.values()
+        )
+
+    def _all_notifications(self, columns):
+        """Return SQL expression selecting given columns from both databases"""
+        return "(SELECT {cols} FROM main.notifications UNION ALL SELECT {cols} FROM volatile.notifications)".format(
+            cols=', '.join(columns)
+        )
+
+    def changes(self, known_ids):
+        # data_version changes only when database is modified by another connection
+        data_version = self._get_data_version()
+        if data_version == self.data_version:
+            return [], set()
+
+        self.data_version = data_version
+
+        stored_ids = {
+            row[0] for row in self.conn.execute("SELECT id FROM {}".format(self._all_notifications(['id'])))
+        }
+
+        removed = known_ids - stored_ids
+        to_load = list(stored_ids - known_ids)
+        added = []
+
+        for i in range(0, len(to_load), self.CHUNK_SIZE):
+            chunk = to_load[i:i + self.CHUNK_SIZE]
+            rows = self.conn.execute(
+                "SELECT id, payload FROM {} WHERE id IN ({})".format(
+                    self._all_notifications(['id', 'payload']), ', '.join('?' * len(chunk))
+                ),
+                chunk
+            )
+
+            for nid, payload in rows:
+                n = self._load(nid, payload)
+                if n:
+                    added.append(n)
+
+        return added, removed
+
+    def _load(self, nid, payload):
+        try:
+            return Notification.from_dict(json.loads(payload), self.plugin_storage, self.load_skeleton)
+        except json.JSONDecodeError as e:
+            logger.warning("Failed to deserialize notification '%s': %s", nid, e)
+        except VersionMismatchError:
+            logger.debug("Notification version mismatch - deleting")
+            with self.conn:
+                for schema in self.SCHEMAS.values():
+                    self.conn.execute("DELETE FROM {}.notifications WHERE id = ?".format(schema), (nid,))
+
+        return None
+
+    def _where(self, severity, persistent, since):
+        # skip notifications which already timed out but weren't deleted yet
+        conditions = ["(timeout IS NULL OR timeout = 0 OR timestamp + timeout > ?)"]
+        params = [Notification.now()]
+
+        if severity:
+            conditions.append("severity IN ({})".format(', '.join('?' * len(severity))))
+            params.extend(severity)
+        if persistent is not None:
+            conditions.append("persistent = ?")
+            params.append(int(bool(persistent)))
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+
+        return ' AND '.join(conditions), params
+
+    def query(self, severity=None, persistent=None, since=None, sort='timestamp', limit=None, offset=0):
+        where, params = self._where(severity, persistent, since)
+        params.extend([-1 if limit is None else limit, offset])
+
+        rows = self.conn.execute(
+            "SELECT {} FROM {} WHERE {} ORDER BY {} LIMIT ? OFFSET ?".format(
+                ', '.join(self.META_COLUMNS), self._all_notifications(self.COLUMNS[:-1]), where, self.ORDER_BY[sort]
+            ),
+            params
+        )
+
+        out = []
+        for row in rows:
+            meta = dict(zip(self.META_COLUMNS, row))
+            meta['persistent'] = bool(meta['persistent'])
+            out.append(meta)
+
+        return out
+
+    def count(self, severity=None, persistent=None, since=None):
+        where, params = self._where(severity, persistent, since)
+
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM {} WHERE {}".format(self._all_notifications(self.COLUMNS[:-1]), where), params
+        ).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,372 @@
+import fcntl
+import json
+import logging
+import os
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from .config import config
+from .exceptions import VersionMismatchError
+from .notification import Notification
+from .watcher import create_watcher
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def flock(path, operation):
+    """
+    Hold advisory lock of given lock file, it is created if missing
+
+    Shared lock needs only read access, so users who can't write to storage can still read it.
+    If missing lock file can't be created either, shared lock is skipped, there is no writer to lock out.
+    """
+    if operation & fcntl.LOCK_EX:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    else:
+        fd = _open_shared_lock(path)
+
+    if fd is None:
+        yield
+        return
+
+    try:
+        fcntl.flock(fd, operation)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _open_shared_lock(path):
+    """Return descriptor of lock file opened for reading or None if it doesn't exist and can't be created"""
+    try:
+        return os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        pass
+
+    try:
+        return os.open(path, os.O_RDONLY | os.O_CREAT, 0o644)
+    except OSError as e:
+        logger.debug("Reading storage without lock, lock file can't be created: %s", e)
+        return None
+
+
+class StorageBackend:
+    """
+    Base class of notification storage backends
+
+    Backend only persists notifications. In-memory state is kept by
+    NotificationStorage which asks backend for changes during sync.
+    """
+    # backend implements query() and count() itself
+    supports_query = False
+    # backend implements load_fallback(), so fallback doesn't have to be kept in memory
+    supports_fallback_loading = False
+
+    def __init__(self, storage_dirs, plugin_storage):
+        self.storage_dirs = storage_dirs
+        self.plugin_storage = plugin_storage
+
+    def save(self, n):
+        """Persist single notification, return True on success"""
+        raise NotImplementedError
+
+    def save_many(self, notifications):
+        """Persist multiple notifications, return True if all of them were saved"""
+        return all([self.save(n) for n in notifications])
+
+    def delete(self, n):
+        """
+        Remove notification from backend
+
+        Return True if notification was removed by this call,
+        False if it was already removed by someone else
+        """
+        raise NotImplementedError
+
+    def dismiss(self, n):
+        """Remove notification due to user interaction"""
+        return self.delete(n)
+
+    def dismiss_many(self, notifications):
+        """Dismiss multiple notifications, return set of ids removed by this call"""
+        return {n.notif_id for n in notifications if self.dismiss(n)}
+
+    def load_fallback(self, n):
+        """Return fallback of stored notification or None if it no longer exists"""
+        raise NotImplementedError
+
+    def save_skeleton(self, skeleton):
+        """
+        Persist definition of skeleton referenced by stored notifications
+
+        Every distinct definition is stored only once
+        """
+        raise NotImplementedError
+
+    def load_skeleton(self, definition_hash):
+        """Return stored skeleton definition or None"""
+        raise NotImplementedError
+
+    def changes(self, known_ids):
+        """
+        Return changes since last call as tuple (added, removed)
+
+        `added` is list of new notification instances which are not in `known_ids`
+        `removed` is set of ids of notifications which no longer exist
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileStorageBackend(StorageBackend):
+    """
+    Backend storing every notification in separate json file
+
+    Skeleton definitions are stored in separate directory in persistent storage.
+    Files are written atomically (temporary file + rename). Directory mutations
+    take exclusive advisory lock and rescans shared one, so other processes
+    see batch of changes either whole or not at all.
+    """
+    SKELETON_DIR = 'skeletons'
+    LOCK_FILE = 'notifications.lock'
+
+    supports_fallback_loading = True
+    # fewer new files are loaded serially, starting thread pool wouldn't pay off
+    PARALLEL_LOAD_MIN = 64
+
+    def __init__(self, storage_dirs, plugin_storage):
+        super().__init__(storage_dirs, plugin_storage)
+
+        # files are read by other tools and older versions, compact format has to be enabled explicitly
+        self.format = config.getint('settings', 'file_format')
+        self.load_workers = config.getint('settings', 'load_workers')
+        self.skeleton_dir = os.path.join(self.storage_dirs['persistent'], self.SKELETON_DIR)
+        self.skeletons = {}
+        self.lock_path = os.path.join(self.storage_dirs['volatile'], self.LOCK_FILE)
+
+        self.paths = [
+            Path(self.storage_dirs['volatile']),
+            Path(self.storage_dirs['persistent']),
+        ]
+        self.watcher = create_watcher(self.paths, config.get('settings', 'watcher'))
+
+    def _file_path(self, n):
+        if n.persistent:
+            storage_dir = self.storage_dirs['persistent']
+        else:
+            storage_dir = self.storage_dirs['volatile']
+
+        return os.path.join(storage_dir, "{}.json".format(n.notif_id))
+
+    def _save_skeletons(self, notifications):
+        if self.format == 1:
+            # skeleton is embedded in every notification
+            return True
+
+        return all([self.save_skeleton(n.skeleton) for n in notifications])
+
+    def save(self, n):
+        return self.save_many([n])
+
+    def save_many(self, notifications):
+        """
+        Write all notifications to temporary files and then rename them in one batch
+
+        Persistent notifications are synced to disk, storage directory is synced only once
+        """
+        if not self._save_skeletons(notifications):
+            return False
+
+        renames = []
+        try:
+            for n in notifications:
+                path = self._file_path(n)
+                # temporary files don't match '*.json' so they are ignored by readers
+                tmp_path = "{}.{}.tmp".format(path, os.getpid())
+                renames.append((tmp_path, path))
+
+                with open(tmp_path, 'w') as f:
+                    f.write(n.serialize(self.format))
+
+                    if n.persistent:
+                        f.flush()
+                        os.fsync(f.fileno())
+
+            with flock(self.lock_path, fcntl.LOCK_EX):
+                for tmp_path, path in renames:
+                    os.replace(tmp_path, path)
+
+            if any(n.persistent for n in notifications):
+                self._fsync_dir(self.storage_dirs['persistent'])
+        except OSError as e:
+            logger.error("Error during writing notifications to disk: %s", e)
+
+            for tmp_path, _ in renames:
+                if os.path.exists(tmp_path):
+                    self._remove_file(tmp_path)
+
+            return False
+
+        return True
+
+    @staticmethod
+    def _fsync_dir(path):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def delete(self, n):
+        with flock(self.lock_path, fcntl.LOCK_EX):
+            return self._remove_file(self._file_path(n))
+
+    def dismiss_many(self, notifications):
+        with flock(self.lock_path, fcntl.LOCK_EX):
+            return {n.notif_id for n in notifications if self._remove_file(self._file_path(n))}
+
+    def load_fallback(self, n):
+        data = Notification.read_file(self._file_path(n))
+
+        return data.get('fallback') if data else None
+
+    def save_skeleton(self, skeleton):
+        definition_hash = skeleton.get_reference()['hash']
+        if definition_hash in self.skeletons:
+            return True
+
+        path = os.path.join(self.skeleton_dir, "{}.json".format(definition_hash))
+        definition = skeleton.serialize()
+
+        if not os.path.exists(path):
+            tmp_path = "{}.{}.tmp".format(path, os.getpid())
+
+            try:
+                os.makedirs(self.skeleton_dir, exist_ok=True)
+
+                with open(tmp_path, 'w') as f:
+                    json.dump(definition, f)
+
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.error("Error during writing skeleton definition to disk: %s", e)
+                return False
+
+        self.skeletons[definition_hash] = definition
+        return True
+
+    def load_skeleton(self, definition_hash):
+        if definition_hash not in self.skeletons:
+            path = os.path.join(self.skeleton_dir, "{}.json".format(definition_hash))
+
+            try:
+                with open(path, 'r') as f:
+                    self.skeletons[definition_hash] = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Failed to load skeleton definition '%s': %s", path, e)
+                return None
+
+        return self.skeletons[definition_hash]
+
+    def changes(self, known_ids):
+        # writers rename whole batch under exclusive lock, so shared lock ensures
+        # that both inotify events and directory listing contain batch whole or not at all
+        with flock(self.lock_path, fcntl.LOCK_SH):
+            changes = self.watcher.poll()
+
+            if changes is None:
+                changes = self._rescan(known_ids)
+
+        added = []
+        removed = set()
+        to_load = []
+        to_delete_invalid = []
+
+        for nid, path in changes.items():
+            if path is None:
+                removed.add(nid)
+            elif nid not in known_ids:
+                to_load.append(str(path))
+
+        for filepath, json_data in self._read_files(to_load):
+            if json_data is None:
+                continue
+
+            try:
+                n = Notification.from_dict(json_data, self.plugin_storage, self.load_skeleton)
+            except VersionMismatchError:
+                logger.debug("Notification version mismatch - marking to delete")
+                to_delete_invalid.append(filepath)
+                continue
+
+            added.append(n)
+
+        # delete invalid notifications from fs
+        if to_delete_invalid:
+            with flock(self.lock_path, fcntl.LOCK_EX):
+                for path in to_delete_invalid:
+                    self._remove_file(path)
+
+        return added, removed
+
+    def _read_files(self, paths):
+        """
+        Read and deserialize notification files, return list of (path, data or None)
+
+        Many files (e.g. on cold load) are read by pool of `load_workers` threads
+        """
+        if self.load_workers < 2 or len(paths) < self.PARALLEL_LOAD_MIN:
+            return [(path, Notification.read_file(path)) for path in paths]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        def read_chunk(chunk):
+            return [(path, Notification.read_file(path)) for path in chunk]
+
+        # one chunk per worker, future per file would cost more than reading it
+        chunks = [paths[i::self.load_workers] for i in range(self.load_workers)]
+
+        with ThreadPoolExecutor(max_workers=self.load_workers) as executor:
+            return [result for chunk in executor.map(read_chunk, chunks) for result in chunk]
+
+    def _rescan(self, known_ids):
+        """
+        Compare whole content of storage directories with in-memory state
+
+        Return changes in the same format as watcher does
+        """
+        notification_ids = {}
+
+        for path in self.paths:
+            for p in path.glob('*.json'):
+                notification_ids[p.stem] = p
+
+        changes = {nid: None for nid in known_ids - notification_ids.keys()}
+
+        for nid in notification_ids.keys() - known_ids:
+            changes[nid] = notification_ids[nid]
+
+        return changes
+
+    def _remove_file(self, filepath):
+        """Remove file from FS"""
+        logger.debug("Removing file %s", filepath)
+
+        try:
+            os.unlink(filepath)
+        except FileNotFoundError:
+            # already removed by another process
+            logger.debug("File '%s' was already removed", filepath)
+            return False
+        except OSError as e:
+            logger.error("Cannot remove file '%s'. Reason: %s", filepath, e)
+            return False
+
+        return True
+
+    def close(self):
+        self.watcher.close()
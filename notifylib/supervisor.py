@@ -1,29 +1,113 @@
 import logging
 import os
+import selectors
 import shlex
-import signal
 import subprocess
-import sys
+import time
+
+from .jobs import JobStore
 
 logger = logging.getLogger(__name__)
 
 
+class OutputBuffer:
+    """
+    Bounded capture of command output stream
+
+    Only the last `limit` bytes are kept. Complete lines are logged
+    (on debug level) as they arrive.
+    """
+    LIMIT = 16 * 1024
+
+    def __init__(self, name, limit=LIMIT):
+        self.name = name
+        self.limit = limit
+        self.data = bytearray()
+        self.dropped = 0
+        self.partial = b''
+
+    def write(self, data):
+        self.data += data
+        if len(self.data) > self.limit:
+            excess = len(self.data) - self.limit
+            del self.data[:excess]
+            self.dropped += excess
+
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+
+        *lines, self.partial = (self.partial + data).split(b'\n')
+        if len(self.partial) > self.limit:
+            # don't keep endless line in memory just for logging
+            lines.append(self.partial)
+            self.partial = b''
+
+        for line in lines:
+            self._log(line)
+
+    def close(self):
+        """Log incomplete last line"""
+        if self.partial:
+            self._log(self.partial)
+            self.partial = b''
+
+    def _log(self, line):
+        logger.debug("%s: %s", self.name, line[:self.limit].decode(errors='replace'))
+
+    def getvalue(self):
+        """Return captured output, truncated beginning is replaced by note"""
+        text = self.data.decode(errors='replace')
+        if self.dropped:
+            text = "[{} bytes truncated]\n{}".format(self.dropped, text)
+
+        return text
+
+
 class Supervisor:
-    def __init__(self):
+    """
+    Run command in standalone process which outlives caller
+
+    Used when there is no long-running process to run actions (see ActionRunner).
+    Progress of command is recorded in job record if it is given.
+    """
+    # how long terminated process has to exit before it is killed
+    KILL_TIMEOUT = 5
+    CHUNK_SIZE = 4096
+
+    def __init__(self, jobs=None, record=None):
         self.process = None
         self.cmd = None
         self.cmd_args = None
         self.timeout = None
+        self.timed_out = False
+        self.stdout = OutputBuffer('stdout')
+        self.stderr = OutputBuffer('stderr')
+        self.jobs = jobs
+        self.record = record
+
+    def _update_job(self, **changes):
+        if self.record is not None:
+            self.jobs.update(self.record, **changes)
+
+    def _finish_job(self, state, returncode=None, error=None):
+        if self.record is not None:
+            self.jobs.finish(self.record, state, returncode, self.stdout.getvalue(), self.stderr.getvalue(), error)
 
     def fork(self):
-        """Double fork process"""
+        """
+        Double fork process
+
+        Intermediate child exits right after the second fork and it is reaped here,
+        so long-running caller (e.g. daemon) doesn't accumulate zombies
+        """
         try:
             pid = os.fork()
             if pid > 0:
+                os.waitpid(pid, 0)
                 return
         except OSError as e:
             logger.error("fork #1 failed: %d (%s)", e.errno, e.strerror)
-            os._exit(1)
+            return
 
         os.setsid()
 
@@ -33,15 +117,21 @@ class Supervisor:
                 os._exit(0)
         except OSError as e:
             logger.error("fork #2 failed: %d (%s)", e.errno, e.strerror)
-            sys.exit(1)
+            os._exit(1)
+
+        self._update_job(state=JobStore.RUNNING, started=time.time())
+
+        if not self.run_proc():
+            os._exit(1)
 
-        self.run_proc()
         exit_code = self.join()
 
         if exit_code != 0:
             logger.error("Process exited with exit code %s", exit_code)
-            logger.error("stdout: %s", self.process.stdout.readline())
-            logger.error("stderr: %s", self.process.stderr.readline())
+            logger.error("stdout: %s", self.stdout.getvalue())
+            logger.error("stderr: %s", self.stderr.getvalue())
+
+        self._finish_job(JobStore.TIMED_OUT if self.timed_out else JobStore.FINISHED, exit_code)
 
         # dettach stdin/out/err and close them
         devnull = os.open(os.devnull, os.O_WRONLY)
@@ -53,39 +143,91 @@ class Supervisor:
         os._exit(0)
 
     def run_proc(self):
+        """Start command, return False if it can't be started"""
         try:
-            if self.cmd_args:
-                cmd = f'{self.cmd} {self.cmd_args}'
-            else:
-                cmd = self.cmd
-
             self.process = subprocess.Popen(
-                shlex.split(cmd),
+                self.split_cmd(self.cmd, self.cmd_args),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE)
         except ValueError as e:
             logger.error("Failed to parse command: %s", e)
-            sys.exit(1)
-        except FileNotFoundError:
-            logger.error("Couldn't execute '%s'. Executable '%s' not found", self.cmd, shlex.split(self.cmd)[0])
-            sys.exit(1)
+            error = str(e)
+        except OSError as e:
+            logger.error("Couldn't execute '%s': %s", self.cmd, e)
+            error = str(e)
+        else:
+            return True
+
+        self._finish_job(JobStore.FAILED, error=error)
+        return False
+
+    @staticmethod
+    def split_cmd(cmd, cmd_args=None):
+        """Return argv of action command with optional arguments given as single string"""
+        if cmd_args:
+            cmd = f'{cmd} {cmd_args}'
+
+        return shlex.split(cmd)
 
     def run(self, cmd, cmd_args, timeout):
+        """Run command in double-forked process and return without waiting for it"""
         self.cmd = cmd
         self.cmd_args = cmd_args
         self.timeout = timeout
         self.fork()
 
     def join(self):
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(self.timeout)
-
-        exit_code = self.process.wait()
-
-        signal.alarm(0)
-
-        return exit_code
-
-    def timeout_handler(self, signum, frame):
-        logger.warning("Terminating process due to timeout")
-        self.process.terminate()
+        """
+        Drain output of command until it exits and return its exit code
+
+        Both streams are read as data arrive, so chatty command never blocks on full pipe.
+        Command is terminated after timeout and killed if it ignores termination.
+        """
+        streams = {self.process.stdout.fileno(): self.stdout, self.process.stderr.fileno(): self.stderr}
+        deadline = time.monotonic() + self.timeout
+
+        with selectors.DefaultSelector() as selector:
+            for fd in streams:
+                selector.register(fd, selectors.EVENT_READ)
+
+            while selector.get_map() and deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    deadline = self._escalate()
+                    continue
+
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, self.CHUNK_SIZE)
+                    if data:
+                        streams[key.fd].write(data)
+                    else:
+                        selector.unregister(key.fd)
+
+        for output in streams.values():
+            output.close()
+
+        while True:
+            try:
+                return self.process.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                deadline = self._escalate()
+
+    def _escalate(self):
+        """
+        Terminate command after timeout, kill it if it was already terminated
+
+        Return new deadline or None if there is nothing more to wait for
+        """
+        if self.process.poll() is not None:
+            # output pipes are held open by command's children
+            return None
+
+        if not self.timed_out:
+            logger.warning("Terminating process due to timeout")
+            self.timed_out = True
+            self.process.terminate()
+            return time.monotonic() + self.KILL_TIMEOUT
+
+        logger.warning("Killing process which ignored termination")
+        self.process.kill()
+        return None
@@ -1,6 +1,13 @@
-import pkg_resources
+try:
+    # importing pkg_resources is slow, prefer importlib.metadata when available
+    from importlib.metadata import version as _get_version
+except ImportError:
+    import pkg_resources
+
+    def _get_version(name):
+        return pkg_resources.get_distribution(name).version
 
 try:
-    __version__ = pkg_resources.get_distribution('notification-system').version
+    __version__ = _get_version('notification-system')
 except Exception:
     __version__ = 'unknown'
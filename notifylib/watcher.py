@@ -0,0 +1,204 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+    """
+    Base class of notification directory watchers
+
+    Watcher tells storage what changed in watched directories since last poll,
+    so storage doesn't need to rescan whole directories on every sync.
+    """
+    SUFFIX = '.json'
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def poll(self):
+        """
+        Return changes in watched directories since last call
+
+        Return None if full rescan is needed.
+        Otherwise return dict mapping notification id to path of created file
+        or to None if file was deleted.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(Watcher):
+    """Fallback watcher checking mtime of watched directories"""
+
+    def __init__(self, paths):
+        super().__init__(paths)
+        self.latest_sync = [None for _ in self.paths]
+
+    def poll(self):
+        # stat before rescan so changes made during rescan are caught next time
+        mtimes = [p.stat().st_mtime for p in self.paths]
+
+        if mtimes == self.latest_sync:
+            # nothing changed, we are in sync
+            return {}
+
+        self.latest_sync = mtimes
+        return None
+
+
+class InotifyWatcher(Watcher):
+    """Watcher using Linux inotify via ctypes"""
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    CREATED_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+    DELETED_MASK = IN_MOVED_FROM | IN_DELETE
+    RESCAN_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_Q_OVERFLOW | IN_IGNORED
+
+    EVENT_HEADER = struct.Struct('iIII')
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, paths):
+        super().__init__(paths)
+        self.fd = None
+        self.watches = {}
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+        fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, "inotify_init1 failed: {}".format(os.strerror(err)))
+
+        self.fd = fd
+        self.rescan = True
+
+        for path in self.paths:
+            self._add_watch(path)
+
+    def _add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(str(path)), self.WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, "inotify_add_watch failed on '{}': {}".format(path, os.strerror(err)))
+
+        self.watches[wd] = path
+
+    def _read_events(self):
+        """Read all pending raw events from inotify descriptor"""
+        chunks = []
+
+        while True:
+            try:
+                data = os.read(self.fd, self.READ_SIZE)
+            except BlockingIOError:
+                break
+            except InterruptedError:
+                continue
+
+            if not data:
+                break
+
+            chunks.append(data)
+
+        return b''.join(chunks)
+
+    def _parse_events(self, data):
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].split(b'\0', 1)[0]
+            offset += length
+
+            yield wd, mask, os.fsdecode(name)
+
+    def _rewatch(self):
+        """Try to watch again directories which were deleted or moved"""
+        watched = set(self.watches.values())
+
+        for path in self.paths:
+            if path not in watched and path.is_dir():
+                try:
+                    self._add_watch(path)
+                except OSError as e:
+                    logger.warning("Cannot watch directory '%s': %s", path, e)
+
+    def poll(self):
+        changes = {}
+
+        for wd, mask, name in self._parse_events(self._read_events()):
+            if mask & self.RESCAN_MASK:
+                logger.debug("Inotify requested rescan (mask %#x)", mask)
+                self.rescan = True
+
+                if mask & self.IN_IGNORED:
+                    self.watches.pop(wd, None)
+                continue
+
+            if mask & self.IN_ISDIR or not name.endswith(self.SUFFIX) or wd not in self.watches:
+                continue
+
+            nid = name[:-len(self.SUFFIX)]
+            if mask & self.CREATED_MASK:
+                changes[nid] = self.watches[wd] / name
+            elif mask & self.DELETED_MASK:
+                changes[nid] = None
+
+        if self.rescan:
+            self._rewatch()
+            self.rescan = False
+            return None
+
+        return changes
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __del__(self):
+        self.close()
+
+
+WATCHERS = {
+    'inotify': InotifyWatcher,
+    'poll': PollingWatcher,
+}
+
+
+def create_watcher(paths, backend='auto'):
+    """
+    Create watcher for given directories
+
+    With 'auto' backend try inotify first and fall back to polling
+    """
+    if backend != 'auto':
+        if backend not in WATCHERS:
+            raise ValueError("Unknown watcher backend '{}'".format(backend))
+
+        return WATCHERS[backend](paths)
+
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError) as e:
+        # AttributeError - libc without inotify functions
+        logger.debug("Inotify not available (%s), falling back to polling", e)
+
+    return PollingWatcher(paths)
@@ -27,6 +27,7 @@ setup(
     entry_points={
         "console_scripts": [
             "notify-cli = notifylib.__main__:main",
+            "notifyd = notifylib.daemon:main",
             "create_notification = notifylib.legacy_create:main",
             "list_notifications = notifylib.legacy_list:main",
             "user-notify-display = notifylib.legacy_display:main",
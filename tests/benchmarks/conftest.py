@@ -0,0 +1,44 @@
+import json
+import platform
+import time
+
+import pytest
+
+RESULTS = []
+
+
+@pytest.fixture
+def record_benchmark():
+    """Record single benchmark result to be reported at the end of session"""
+    def record(name, **values):
+        RESULTS.append(dict(name=name, **values))
+
+    return record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+
+    terminalreporter.section("benchmarks")
+
+    for result in RESULTS:
+        values = ', '.join('{}={}'.format(k, v) for k, v in result.items() if k != 'name')
+        terminalreporter.write_line("{}: {}".format(result['name'], values))
+
+
+def pytest_sessionfinish(session):
+    """Write results for comparison between releases"""
+    path = session.config.getoption("--benchmark-json")
+    if not path or not RESULTS:
+        return
+
+    output = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': RESULTS,
+    }
+
+    with open(path, 'w') as f:
+        json.dump(output, f, indent=2)
@@ -0,0 +1,53 @@
+"""Cold load of stored notifications by fresh Api, serial vs parallel file reading"""
+
+import statistics
+import time
+
+import pytest
+
+from notifylib import Api
+
+pytestmark = pytest.mark.benchmark
+
+RUNS = 3
+
+
+@pytest.fixture(scope='module', params=[1000, 10000])
+def stored(request, tmpdir_factory):
+    """Storage directories with given number of notifications, shared by compared loaders"""
+    tmpdir = tmpdir_factory.mktemp('load')
+    settings = {
+        'volatile_dir': str(tmpdir.mkdir('volatile')),
+        'persistent_dir': str(tmpdir.mkdir('persistent')),
+        'bytecode_cache_dir': str(tmpdir.join('cache')),
+    }
+
+    items = [
+        {'skel_id': 'simple.simple', 'data': {'message': 'benchmark {}'.format(i)}, 'persistent': bool(i % 2)}
+        for i in range(request.param)
+    ]
+    Api(confdict={'settings': settings}).create_many(items)
+
+    return request.param, settings
+
+
+@pytest.mark.parametrize('load_workers', [1, 4])
+def test_cold_load(stored, load_workers, record_benchmark):
+    count, settings = stored
+
+    times = []
+    for _ in range(RUNS):
+        api = Api(confdict={'settings': dict(settings, load_workers=str(load_workers))})
+
+        start = time.perf_counter()
+        api.notifications.sync()
+        times.append(time.perf_counter() - start)
+
+        assert len(api.notifications.notifications) == count
+
+    record_benchmark(
+        'load.{}.workers{}'.format(count, load_workers),
+        runs=RUNS,
+        median_ms=round(statistics.median(times) * 1000, 1),
+        per_notification_us=round(statistics.median(times) / count * 1e6, 1),
+    )
@@ -0,0 +1,43 @@
+"""Memory used by notifications kept in memory, measured with tracemalloc"""
+
+import tracemalloc
+
+import pytest
+
+from notifylib import Api
+
+pytestmark = pytest.mark.benchmark
+
+COUNT = 2000
+
+
+@pytest.mark.parametrize('backend', ['files', 'journal', 'sqlite'])
+def test_memory_per_notification(config_dict, backend, record_benchmark):
+    config_dict['settings']['storage_backend'] = backend
+    items = [
+        {'skel_id': 'simple.simple', 'data': {'message': 'benchmark {}'.format(i)}, 'persistent': bool(i % 2)}
+        for i in range(COUNT)
+    ]
+    Api(confdict=config_dict).create_many(items)
+
+    api = Api(confdict=config_dict)
+    # plugins, templates and backend are loaded before measurement
+    api.get_templates()
+    api.notifications.backend
+    api.plugins.get_skeleton('simple.simple')
+
+    tracemalloc.start()
+    try:
+        api.notifications.sync()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(api.notifications.notifications) == COUNT
+
+    record_benchmark(
+        'memory.{}'.format(backend),
+        notifications=COUNT,
+        bytes_per_notification=current // COUNT,
+        peak_bytes_per_notification=peak // COUNT,
+    )
@@ -0,0 +1,153 @@
+"""Latency, throughput and peak memory of Api operations with growing number of notifications"""
+
+import random
+import time
+import tracemalloc
+
+import pytest
+
+from notifylib import Api
+
+pytestmark = pytest.mark.benchmark
+
+SKELETONS = ['simple.simple', 'simple.empty', 'simple.complex']
+# number of measured calls of single-notification operations
+SAMPLES = 200
+# number of measured calls of operations working with all notifications
+RUNS = 5
+
+
+def generate(count):
+    """Synthetic notifications spread across skeletons of simple plugin"""
+    return [
+        {
+            'skel_id': SKELETONS[i % len(SKELETONS)],
+            'data': {'message': 'benchmark message {}'.format(i), 'message2': 'second message {}'.format(i)},
+            'persistent': bool(i % 2),
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(params=[100, 1000, 10000])
+def populated(request, config_dict):
+    """Settings of storage holding given number of notifications"""
+    count = request.param
+    Api(confdict=config_dict).create_many(generate(count))
+
+    return count, config_dict
+
+
+@pytest.fixture
+def warm_api(populated):
+    """Api with all notifications, plugins and templates already loaded"""
+    count, config_dict = populated
+
+    api = Api(confdict=config_dict)
+    api.get_templates()
+    api.notifications.sync()
+
+    return count, api
+
+
+def percentile(times, q):
+    """Nearest-rank percentile of measured times"""
+    ordered = sorted(times)
+    return ordered[max(0, -(-len(ordered) * q // 100) - 1)]
+
+
+def peak_memory(func, *args):
+    """Peak memory allocated while calling func"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def measure(func, calls):
+    """Call func with every argument from calls, return time of every call"""
+    times = []
+    for args in calls:
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def report(record_benchmark, operation, count, times, peak):
+    record_benchmark(
+        'scale.{}.{}'.format(operation, count),
+        notifications=count,
+        calls=len(times),
+        ops_per_sec=round(len(times) / sum(times), 1),
+        p50_ms=round(percentile(times, 50) * 1000, 3),
+        p99_ms=round(percentile(times, 99) * 1000, 3),
+        peak_kib=round(peak / 1024, 1),
+    )
+
+
+def test_create(warm_api, record_benchmark):
+    count, api = warm_api
+    items = generate(SAMPLES + 1)
+
+    times = measure(lambda item: api.create(item.pop('skel_id'), **item), [(item,) for item in items[1:]])
+    peak = peak_memory(lambda item: api.create(item.pop('skel_id'), **item), items[0])
+
+    assert len(api.notifications.get_all()) == count + SAMPLES + 1
+
+    report(record_benchmark, 'create', count, times, peak)
+
+
+def test_get_notifications(warm_api, record_benchmark):
+    count, api = warm_api
+
+    times = measure(api.get_notifications, [()] * RUNS)
+    peak = peak_memory(api.get_notifications)
+
+    assert len(api.get_notifications()) == count
+
+    report(record_benchmark, 'get_notifications', count, times, peak)
+
+
+def test_get_rendered_notification(warm_api, record_benchmark):
+    count, api = warm_api
+    ids = random.Random(count).choices(sorted(api.notifications.get_all()), k=SAMPLES + 1)
+
+    times = measure(api.get_rendered_notification, [(msgid,) for msgid in ids[1:]])
+    peak = peak_memory(api.get_rendered_notification, ids[0])
+
+    report(record_benchmark, 'get_rendered_notification', count, times, peak)
+
+
+def test_call_action(warm_api, record_benchmark, monkeypatch):
+    count, api = warm_api
+    # only library overhead is measured, commands are not run
+    monkeypatch.setattr(Api, 'run_cmd', lambda self, cmd, cmd_args=None: None)
+    ids = random.Random(count).sample(sorted(api.notifications.get_all()), min(count, SAMPLES + 1))
+
+    times = measure(api.call_action, [(msgid, 'default') for msgid in ids[1:]])
+    peak = peak_memory(api.call_action, ids[0], 'default')
+
+    assert len(api.notifications.get_all()) == count - len(ids)
+
+    report(record_benchmark, 'call_action', count, times, peak)
+
+
+def test_sync(populated, record_benchmark):
+    count, config_dict = populated
+
+    def cold_sync():
+        api = Api(confdict=config_dict)
+        api.notifications.sync()
+
+        assert len(api.notifications.notifications) == count
+
+    times = measure(cold_sync, [()] * RUNS)
+    peak = peak_memory(cold_sync)
+
+    report(record_benchmark, 'sync', count, times, peak)
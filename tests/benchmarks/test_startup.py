@@ -0,0 +1,40 @@
+"""Cold-start time of CLI subcommands, every run is a new interpreter"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytestmark = pytest.mark.benchmark
+
+RUNS = 5
+
+SUBCOMMANDS = {
+    'version': ['--version'],
+    'list-templates': ['list', 'templates'],
+    'list-messages': ['list', 'messages'],
+    'add': ['add', '--template', 'simple.simple', '--from-json', '{"message": "benchmark"}'],
+    'get': ['get', '00000000'],
+}
+
+
+@pytest.mark.parametrize('name', SUBCOMMANDS.keys())
+def test_cli_startup(name, config_dict, record_benchmark):
+    confdict = {'settings': {k: str(v) for k, v in config_dict['settings'].items()}}
+    cmd = [sys.executable, '-m', 'notifylib', '--config-dict', json.dumps(confdict)] + SUBCOMMANDS[name]
+
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+
+    record_benchmark(
+        'startup.{}'.format(name),
+        runs=RUNS,
+        median_ms=round(statistics.median(times) * 1000, 1),
+        min_ms=round(min(times) * 1000, 1),
+    )
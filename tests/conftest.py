@@ -3,6 +3,28 @@ import pytest
 
 from pathlib import Path
 from notifylib import Api
+from notifylib.config import config
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", help="Run benchmarks from tests/benchmarks")
+    parser.addoption("--benchmark-json", metavar="PATH", help="Write benchmark results to JSON file")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+
+    skip = pytest.mark.skip(reason="benchmarks are run only with --benchmark")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def default_config():
+    """Config is module-wide singleton so reset it for every test"""
+    config.default_config()
 
 
 @pytest.fixture
@@ -16,11 +38,18 @@ def persistent_dir(tmpdir):
 
 
 @pytest.fixture
-def config_dict(volatile_dir, persistent_dir):
+def bytecode_cache_dir(tmpdir):
+    return tmpdir.join('cache')
+
+
+@pytest.fixture
+def config_dict(tmpdir, volatile_dir, persistent_dir, bytecode_cache_dir):
     return {
         'settings': {
             'volatile_dir': volatile_dir,
             'persistent_dir': persistent_dir,
+            'bytecode_cache_dir': bytecode_cache_dir,
+            'socket_path': tmpdir.join('notifyd.sock'),
         }
     }
 
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from notifylib.actionrunner import ActionRunner
+from notifylib.config import config
+from notifylib.jobs import JobStore
+from notifylib.supervisor import OutputBuffer
+
+
+def test_concurrency_limit(tmpdir):
+    runner = ActionRunner(JobStore(str(tmpdir)), concurrency=2)
+
+    async def scenario():
+        job_ids = [runner.submit('sleep', '0.3') for _ in range(4)]
+        await runner.join()
+
+        return [runner.jobs.get(job_id) for job_id in job_ids]
+
+    start = time.monotonic()
+    jobs = asyncio.run(scenario())
+
+    assert time.monotonic() - start >= 0.6
+    assert [job['state'] for job in jobs] == [JobStore.FINISHED] * 4
+    # the last two jobs waited in queue
+    assert min(job['started'] for job in jobs[2:]) >= max(job['started'] for job in jobs[:2]) + 0.25
+
+
+def test_timeout(tmpdir):
+    config.load_from_dict({'settings': {'cmd_timeout': '1'}})
+    runner = ActionRunner(JobStore(str(tmpdir)), concurrency=1)
+
+    job = asyncio.run(runner.run('sleep', '10'))
+
+    assert job['state'] == JobStore.TIMED_OUT
+    assert job['returncode'] < 0
+    assert job['finished'] - job['started'] < 5
+
+
+def test_output_captured(tmpdir):
+    config.load_from_dict({'settings': {'cmd_timeout': '10'}})
+    runner = ActionRunner(JobStore(str(tmpdir)), concurrency=1)
+
+    job = asyncio.run(runner.run('sh', "-c 'yes | head -c 1000000; echo done >&2; exit 3'"))
+
+    assert job['state'] == JobStore.FINISHED
+    assert job['returncode'] == 3
+    assert job['stdout'].startswith("[{} bytes truncated]\n".format(1000000 - OutputBuffer.LIMIT))
+    assert job['stderr'] == "done\n"
+    assert runner.jobs.get(job['id']) == job
+
+
+def test_cleanup(tmpdir):
+    jobs = JobStore(str(tmpdir))
+    old = jobs.new('/bin/true')
+    tmpdir.join('{}.json'.format(old['id'])).setmtime(time.time() - JobStore.RETENTION - 1)
+
+    jobs.last_cleanup = None
+    new = jobs.new('/bin/true')
+
+    assert jobs.get(old['id']) is None
+    assert jobs.get(new['id']) == new
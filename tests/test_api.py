@@ -1,10 +1,18 @@
+import json
+import subprocess
+import sys
+import time
+
+import py
 import pytest
 
 from notifylib import Api
+from notifylib.notification import Notification
 from notifylib.exceptions import (
     InvalidOptionsError,
     MediaTypeNotAvailableError,
     NoSuchActionError,
+    NoSuchJobError,
     NoSuchNotificationError,
     NoSuchNotificationSkeletonError,
 )
@@ -117,6 +125,48 @@ def test_create_notification_with_invalid_default_action(api, user_opts):
     assert n['metadata']['default_action'] == 'dismiss'
 
 
+def test_create_many(api, user_opts):
+    items = [
+        user_opts,
+        dict(user_opts, severity='foobar'),
+        dict(user_opts, skel_id='foo.bar'),
+        dict(user_opts, persistent=True),
+    ]
+
+    results = api.create_many(items)
+
+    assert [r['id'] is None for r in results] == [False, True, True, False]
+    assert "Invalid severity level 'foobar'" in results[1]['error']
+    assert set(api.get_notifications()) == {results[0]['id'], results[3]['id']}
+    assert api.get_rendered_notification(results[3]['id'])['metadata']['persistent'] is True
+
+
+def test_create_many_invalid_items(api, user_opts):
+    items = [
+        dict(user_opts, data='x'),
+        dict(user_opts, timeout='abc'),
+        dict(user_opts, skel_id=5),
+        user_opts,
+    ]
+
+    results = api.create_many(items)
+
+    assert [r['id'] is None for r in results] == [True, True, True, False]
+    assert set(api.get_notifications()) == {results[3]['id']}
+
+
+def test_create_many_save_failed(api, user_opts, monkeypatch):
+    api.create(**user_opts)
+    seq = api.get_sequence()
+    monkeypatch.setattr(type(api.notifications.backend), 'save_many', lambda self, notifications: False)
+
+    results = api.create_many([user_opts, user_opts])
+
+    assert all(r['id'] is None for r in results)
+    assert len(api.get_notifications()) == 1
+    assert api.get_changes(seq) == []
+
+
 @pytest.mark.xfail
 def test_create_notification_with_custom_action_timeout():
     pass
@@ -240,3 +290,205 @@ def test_call_nonexisting_action(api, user_opts):
 def test_call_action_on_nonexisting_notification(api, user_opts):
     with pytest.raises(NoSuchNotificationError):
         api.call_action('12345678', 'default')
+
+
+def test_call_action_job(api, user_opts):
+    nid = api.create(**user_opts)
+    job_id = api.call_action(nid, 'dummy')
+
+    # command runs in standalone process
+    deadline = time.monotonic() + 5
+    while api.get_job(job_id)['state'] != 'finished' and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    job = api.get_job(job_id)
+
+    assert job['cmd'] == '/bin/true'
+    assert job['state'] == 'finished'
+    assert job['returncode'] == 0
+    assert api.call_action(api.create(**user_opts), 'dismiss') is None
+
+    with pytest.raises(NoSuchJobError):
+        api.get_job('0' * 32)
+
+
+def test_call_actions(api, user_opts, monkeypatch):
+    commands = []
+
+    def run_cmd(self, cmd, cmd_args=None):
+        commands.append(cmd)
+        return 'job{}'.format(len(commands))
+
+    monkeypatch.setattr(Api, 'run_cmd', run_cmd)
+
+    nids = [api.create(**user_opts) for _ in range(3)]
+    results = api.call_actions([
+        (nids[0], 'dummy'),
+        (nids[1][:8], 'dummy'),
+        (nids[2], 'dismiss'),
+        (nids[2], 'fooaction'),
+        ('12345678', 'dummy'),
+    ])
+
+    assert [r['id'] for r in results[:3]] == nids
+    assert results[3]['error'] == "Notification does not have action 'fooaction'"
+    assert results[4]['error'] == "Notification with ID '12345678' does not exist"
+    # the same command is run only once
+    assert commands == ['/bin/true']
+    assert [r['job'] for r in results] == ['job1', 'job1', None, None, None]
+    assert api.get_notifications() == {}
+
+
+@pytest.mark.parametrize('backend', ['files', 'journal', 'sqlite'])
+def test_dismiss_many(config_dict, user_opts, backend):
+    config_dict['settings']['storage_backend'] = backend
+    api = Api(confdict=config_dict)
+    other = Api(confdict=config_dict)
+
+    nids = [api.create(**user_opts) for _ in range(5)]
+
+    # already dismissed elsewhere
+    other.dismiss_many(nids[:1])
+    results = api.dismiss_many(nids)
+
+    assert results[0]['error'] == "Notification with ID '{}' does not exist".format(nids[0])
+    assert [r['id'] for r in results[1:]] == nids[1:]
+    assert api.get_notifications() == {}
+    assert other.get_notifications() == {}
+
+
+@pytest.fixture(params=['files', 'sqlite'])
+def query_api(request, config_dict):
+    config_dict['settings']['storage_backend'] = request.param
+    return Api(confdict=config_dict)
+
+
+def test_query_notifications(query_api, user_opts):
+    nid = query_api.create(**user_opts)
+    user_opts['severity'] = 'error'
+    user_opts['persistent'] = True
+    nid2 = query_api.create(**user_opts)
+
+    result = query_api.query_notifications()
+
+    assert {m['id'] for m in result} == {nid, nid2}
+    assert result[0]['skeleton_id'] == 'simple.simple'
+
+    errors = query_api.query_notifications(severity='error')
+
+    assert [m['id'] for m in errors] == [nid2]
+    assert errors[0]['persistent'] is True
+    assert errors[0]['short_id'] == nid2[:8]
+    assert query_api.count_notifications(severity=['info', 'error']) == 2
+    assert query_api.count_notifications(persistent=False) == 1
+
+
+def test_query_notifications_paginate(query_api, user_opts):
+    for severity in ['info', 'error', 'warning', 'announcement']:
+        user_opts['severity'] = severity
+        query_api.create(**user_opts)
+
+    by_severity = query_api.query_notifications(sort='severity')
+
+    assert [m['severity'] for m in by_severity] == ['error', 'warning', 'info', 'announcement']
+
+    page = query_api.query_notifications(sort='severity', limit=2, offset=1)
+
+    assert [m['severity'] for m in page] == ['warning', 'info']
+
+
+def test_get_notifications_page(query_api, user_opts, monkeypatch):
+    for ts, severity in enumerate(['info', 'error', 'warning', 'error'], start=1500000000):
+        monkeypatch.setattr(Notification, 'now', staticmethod(lambda: ts))
+        user_opts['severity'] = severity
+        query_api.create(**user_opts)
+
+    assert len(query_api.get_notifications()) == 4
+
+    page = query_api.get_notifications(sort='timestamp', limit=2, offset=1)
+
+    assert [n['metadata']['timestamp'] for n in page.values()] == [1500000002, 1500000001]
+
+    errors = query_api.get_notifications(severity='error', sort='severity')
+
+    assert [n['metadata']['timestamp'] for n in errors.values()] == [1500000003, 1500000001]
+    assert len(query_api.get_notifications(since=1500000002)) == 2
+
+
+def test_get_notifications_renders_only_page(api, user_opts):
+    for _ in range(10):
+        api.create(**user_opts)
+
+    api.get_notifications(sort='timestamp', limit=3)
+
+    assert api.get_render_cache_stats()['size'] == 3
+
+
+@pytest.mark.parametrize('sort', ['timestamp', 'severity'])
+def test_query_notifications_ties(query_api, user_opts, monkeypatch, sort):
+    monkeypatch.setattr(Notification, 'now', staticmethod(lambda: 1500000000))
+    nids = [query_api.create(**user_opts) for _ in range(5)]
+
+    # ties are broken by id the same way in every backend
+    assert [m['id'] for m in query_api.query_notifications(sort=sort)] == sorted(nids, reverse=True)
+    assert list(query_api.get_notifications(sort=sort, limit=3)) == sorted(nids, reverse=True)[:3]
+
+
+def test_query_notifications_invalid_options(api):
+    with pytest.raises(InvalidOptionsError):
+        api.query_notifications(severity='foobar')
+
+    with pytest.raises(InvalidOptionsError):
+        api.query_notifications(sort='foobar')
+
+
+def test_precompile_templates(api, bytecode_cache_dir):
+    compiled = api.precompile_templates()
+
+    assert sorted(compiled) == ['simple/templates/complex.j2', 'simple/templates/empty.j2', 'simple/templates/simple.j2']
+    assert len(bytecode_cache_dir.listdir()) == 3
+
+
+def test_bytecode_cache_insecure_dir(config_dict, bytecode_cache_dir):
+    bytecode_cache_dir.ensure(dir=True).chmod(0o777)
+
+    api = Api(confdict=config_dict)
+
+    assert api.precompile_templates() == []
+    assert bytecode_cache_dir.listdir() == []
+
+
+def test_bytecode_cache_invalidated_by_mtime(api, user_opts, bytecode_cache_dir, tmpdir):
+    plugin_dir = tmpdir.join('plugins')
+    py.path.local(api.plugins.plugin_dir).join('simple').copy(plugin_dir.join('simple'))
+
+    api = Api(confdict={'settings': {'plugin_dir': plugin_dir}})
+    api.precompile_templates()
+    nid = api.create(**user_opts)
+
+    template = plugin_dir.join('simple', 'templates', 'simple.j2')
+    template.write('Changed {{ message }}')
+    template.setmtime(template.mtime() + 10)
+
+    api = Api()
+
+    assert api.get_rendered_notification(nid)['message'] == 'Changed dragons kittens turtles sloths'
+    assert len(bytecode_cache_dir.listdir()) == 4
+
+
+def test_lazy_initialization(config_dict):
+    """Heavy modules are imported and plugins loaded only when needed"""
+    code = """
+import json, sys
+from notifylib import Api
+from notifylib.notification import Notification
+
+api = Api(confdict=json.loads(sys.argv[1]))
+print(sorted(m for m in ('jinja2', 'yaml', 'sqlite3') if m in sys.modules))
+api.get_templates()
+print(sorted(m for m in ('jinja2', 'yaml', 'sqlite3') if m in sys.modules))
+"""
+    confdict = {'settings': {k: str(v) for k, v in config_dict['settings'].items()}}
+    out = subprocess.run([sys.executable, '-c', code, json.dumps(confdict)], stdout=subprocess.PIPE, check=True)
+
+    assert out.stdout.decode().splitlines() == ['[]', "['yaml']"]
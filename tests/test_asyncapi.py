@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from notifylib.asyncapi import AsyncApi
+from notifylib.config import config
+from notifylib.exceptions import NoSuchNotificationError
+
+
+@pytest.fixture
+def async_api(config_dict):
+    api = AsyncApi(confdict=config_dict)
+    yield api
+    api.close()
+
+
+def test_create_and_list(async_api, user_opts):
+    async def scenario():
+        nids = await asyncio.gather(*(async_api.create(**user_opts) for _ in range(5)))
+        page = await async_api.get_notifications(sort='timestamp', limit=3)
+
+        return nids, page
+
+    nids, page = asyncio.run(scenario())
+
+    assert len(set(nids)) == 5
+    assert len(page) == 3
+    assert set(page) <= set(nids)
+
+
+def test_call_action(async_api, user_opts):
+    async def scenario():
+        nid = await async_api.create(**user_opts)
+        nid2 = await async_api.create(**user_opts)
+
+        job_id = await async_api.call_action(nid, 'dummy')
+        results = await async_api.call_actions([(nid2, 'dummy'), ('12345678', 'dummy')])
+
+        with pytest.raises(NoSuchNotificationError):
+            await async_api.call_action(nid, 'dummy')
+
+        return await async_api.get_job(job_id), results, await async_api.get_notifications()
+
+    job, results, notifications = asyncio.run(scenario())
+
+    assert job['state'] == 'finished'
+    assert job['returncode'] == 0
+    assert results[0]['job'] != job['id']
+    assert results[1]['error'] == "Notification with ID '12345678' does not exist"
+    assert notifications == {}
+
+
+def test_run_cmd_timeout(async_api):
+    config.load_from_dict({'settings': {'cmd_timeout': '1'}})
+
+    assert asyncio.run(async_api.run_cmd('/bin/true')) == 0
+    assert asyncio.run(async_api.run_cmd('sleep', '10')) < 0
+    assert asyncio.run(async_api.run_cmd('/nonexistent/command')) is None
+
+
+def test_events(async_api, user_opts):
+    async def scenario():
+        events = async_api.aevents(since=0, poll_interval=0.01)
+        nid = await async_api.create(**user_opts)
+        event = await events.__anext__()
+        await events.aclose()
+
+        return nid, event
+
+    nid, event = asyncio.run(scenario())
+
+    assert event['notification']['id'] == nid
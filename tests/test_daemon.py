@@ -0,0 +1,167 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+from notifylib import Api
+from notifylib.client import ApiClient, connect
+from notifylib.daemon import NotificationDaemon
+from notifylib.exceptions import (
+    DaemonError,
+    InvalidOptionsError,
+    NoSuchActionError,
+    NoSuchNotificationError,
+    NoSuchNotificationSkeletonError,
+)
+
+
+@pytest.fixture
+def socket_path():
+    # unix socket path length is limited, pytest tmpdir might be too long
+    path = tempfile.mkdtemp()
+    yield path + '/notifyd.sock'
+    shutil.rmtree(path)
+
+
+@pytest.fixture
+def daemon(api, socket_path):
+    d = NotificationDaemon(api, socket_path)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(d.start())
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(d.wait_stopped(),))
+    thread.start()
+
+    yield d
+
+    d.stop()
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def client(daemon, socket_path):
+    c = connect(confdict={'settings': {'socket_path': socket_path}})
+    yield c
+    c.close()
+
+
+def test_connect_fallback(config_dict):
+    assert isinstance(connect(confdict=config_dict), Api)
+
+
+def test_connect_daemon(client):
+    assert isinstance(client, ApiClient)
+
+
+def test_create_list_dismiss(client, user_opts):
+    nid = client.create(**user_opts)
+
+    assert list(client.get_notifications()) == [nid]
+    assert 'dragons kittens turtles sloths' in client.get_rendered_notification(nid[:8])['message']
+    assert client.count_notifications() == 1
+
+    client.call_action(nid, 'dismiss')
+
+    assert client.get_notifications() == {}
+
+
+def test_create_many(client, user_opts):
+    results = client.create_many([user_opts, dict(user_opts, skel_id='foo.bar')])
+
+    assert results[1]['id'] is None
+    assert list(client.get_notifications()) == [results[0]['id']]
+
+
+def test_changes(client, user_opts):
+    seq = client.get_sequence()
+    nid = client.create(**user_opts)
+    client.dismiss_many([nid])
+
+    assert [e['type'] for e in client.get_changes(seq)] == ['created', 'dismissed']
+
+
+def test_exceptions(client, user_opts):
+    with pytest.raises(NoSuchNotificationError):
+        client.get_rendered_notification('12345678')
+
+    user_opts['explicit_dismiss'] = False
+    nid = client.create(**user_opts)
+
+    with pytest.raises(NoSuchActionError):
+        client.call_action(nid, 'dismiss')
+
+    user_opts['skel_id'] = 'foo.bar'
+
+    with pytest.raises(NoSuchNotificationSkeletonError):
+        client.create(**user_opts)
+
+
+def test_unexpected_errors(client, user_opts):
+    with pytest.raises(DaemonError):
+        client.call_actions([['x']])
+
+    with pytest.raises(InvalidOptionsError):
+        client.create('simple.simple', data='x')
+
+    # daemon keeps serving after failed request
+    assert client.create(**user_opts)
+
+
+@pytest.fixture
+def small_line_limit(monkeypatch):
+    monkeypatch.setattr(NotificationDaemon, 'LINE_LIMIT', 1024)
+
+
+def test_request_too_long(small_line_limit, client, user_opts):
+    user_opts['data']['message'] = 'x' * 2048
+
+    with pytest.raises(DaemonError, match='Request too long'):
+        client.create(**user_opts)
+
+
+def test_multiple_clients(client, socket_path, user_opts):
+    other = ApiClient(socket_path)
+    nid = other.create(**user_opts)
+    other.close()
+
+    assert list(client.get_notifications()) == [nid]
+
+
+def test_expiry_timer(client, user_opts, volatile_dir):
+    nid = client.create(timeout=1, **user_opts)
+    path = volatile_dir.join('{}.json'.format(nid))
+
+    assert path.check()
+
+    # daemon removes expired notification without any further request
+    deadline = time.monotonic() + 5
+    while path.check() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert not path.check()
+
+
+def test_call_action_job(client, user_opts):
+    nid = client.create(**user_opts)
+    nid2 = client.create(**user_opts)
+
+    job_id = client.call_action(nid, 'dummy')
+    results = client.call_actions([(nid2, 'dummy')])
+
+    # commands are run by daemon in background
+    for job_id in [job_id, results[0]['job']]:
+        deadline = time.monotonic() + 5
+        while client.get_job(job_id)['state'] != 'finished' and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert client.get_job(job_id)['returncode'] == 0
+
+
+def test_unknown_method(daemon):
+    response = daemon.dispatch({'method': 'store', 'params': {}})
+
+    assert response['error']['type'] == 'InvalidRequest'
@@ -0,0 +1,90 @@
+import asyncio
+
+from collections import deque
+
+import pytest
+
+from notifylib import Api
+from notifylib.exceptions import EventsLostError
+from notifylib.notification import Notification
+
+
+def test_subscribe(api, user_opts, monkeypatch):
+    now = 1500000000
+    monkeypatch.setattr(Notification, 'now', staticmethod(lambda: now))
+
+    received = []
+    token = api.subscribe(received.append)
+
+    nid = api.create(**user_opts)
+    nid2 = api.create(timeout=10, **user_opts)
+    api.call_action(nid, 'dismiss')
+
+    now += 10
+    api.get_notifications()
+    api.unsubscribe(token)
+    api.create(**user_opts)
+
+    assert [(e['type'], e['notification']['id']) for e in received] == [
+        ('created', nid),
+        ('created', nid2),
+        ('dismissed', nid),
+        ('expired', nid2),
+    ]
+    assert [e['seq'] for e in received] == [1, 2, 3, 4]
+
+
+def test_changes_since(api, user_opts):
+    nids = [api.create(**user_opts) for _ in range(3)]
+
+    assert [e['notification']['id'] for e in api.get_changes(0)] == nids
+    assert [e['notification']['id'] for e in api.get_changes(2)] == nids[2:]
+    assert api.get_changes(api.get_sequence()) == []
+
+
+def test_changes_lost(api, user_opts):
+    api.notifications.events.events = deque(maxlen=2)
+
+    for _ in range(3):
+        api.create(**user_opts)
+
+    with pytest.raises(EventsLostError):
+        api.get_changes(0)
+
+    assert len(api.get_changes(1)) == 2
+
+
+def test_changes_since_unknown_sequence(api, user_opts):
+    api.create(**user_opts)
+
+    # sequence number from previous lifetime of daemon
+    with pytest.raises(EventsLostError):
+        api.get_changes(api.get_sequence() + 10)
+
+
+def test_events_of_other_instance(config_dict, user_opts):
+    reader = Api(confdict=config_dict)
+    writer = Api(confdict=config_dict)
+
+    events = reader.events(poll_interval=0.01)
+    nid = writer.create(**user_opts)
+
+    assert next(events)['notification']['id'] == nid
+
+    writer.call_action(nid, 'dismiss')
+    event = next(events)
+
+    assert (event['type'], event['notification']['id']) == ('dismissed', nid)
+
+
+def test_async_events(config_dict, user_opts):
+    reader = Api(confdict=config_dict)
+    writer = Api(confdict=config_dict)
+
+    async def first_event():
+        async for event in reader.aevents(since=0, poll_interval=0.01):
+            return event
+
+    nid = writer.create(**user_opts)
+
+    assert asyncio.run(first_event())['notification']['id'] == nid
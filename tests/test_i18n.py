@@ -0,0 +1,61 @@
+import gettext
+
+import pytest
+
+from notifylib import pluginstorage
+
+
+class UpperTranslations(gettext.NullTranslations):
+    def gettext(self, message):
+        return message.upper()
+
+
+@pytest.fixture
+def translation_loads(monkeypatch):
+    """Fake catalogs: 'up' language translates to upper case, record every load"""
+    loads = []
+
+    def translation(domain, localedir=None, languages=None, fallback=False):
+        loads.append(languages[0])
+
+        if languages == ['up']:
+            return UpperTranslations()
+
+        return gettext.NullTranslations()
+
+    monkeypatch.setattr(pluginstorage.gettext, 'translation', translation)
+
+    return loads
+
+
+def test_render_in_multiple_languages(api, user_opts, translation_loads):
+    nid = api.create(**user_opts)
+
+    assert 'SIMPLE MESSAGE' in api.get_rendered_notification(nid, lang='up')['message']
+    assert api.get_rendered_notification(nid, lang='up')['actions']['dummy'] == 'DUMMY ACTION'
+    # translation in one language doesn't leak to another one
+    assert 'Simple message' in api.get_rendered_notification(nid, lang='cs')['message']
+    assert api.get_rendered_notification(nid, lang='cs')['actions']['dummy'] == 'Dummy action'
+
+
+def test_translation_loaded_once_per_language(api, user_opts, translation_loads):
+    for _ in range(5):
+        api.create(**user_opts)
+
+    api.notifications.render_cache.clear()
+    api.get_notifications(lang='up')
+    api.get_notifications(lang='cs')
+
+    assert sorted(translation_loads) == ['cs', 'en', 'up']
+
+
+def test_action_titles_translated_once(api, user_opts, translation_loads):
+    for _ in range(3):
+        api.create(**user_opts)
+
+    api.get_notifications(lang='up')
+    titles = api.plugins.get_action_titles('simple', 'up')
+
+    assert titles == {'dummy': 'DUMMY ACTION', 'reject': 'REJECT CURRENT UPDATE'}
+    assert api.plugins.get_action_titles('simple', 'up') is titles
+    assert api.plugins.get_action_titles('foo', 'up') is None
@@ -0,0 +1,59 @@
+from notifylib.rendercache import RenderCache
+
+
+def test_lru_eviction():
+    cache = RenderCache(maxsize=2)
+    cache.put(('a', 'plain'), 1)
+    cache.put(('b', 'plain'), 2)
+    cache.get(('a', 'plain'))
+    cache.put(('c', 'plain'), 3)
+
+    assert cache.get(('b', 'plain')) is None
+    assert cache.get(('a', 'plain')) == 1
+    assert cache.get(('c', 'plain')) == 3
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_invalidate():
+    cache = RenderCache()
+    cache.put(('a', 'plain', 'en'), 1)
+    cache.put(('a', 'html', 'cs'), 2)
+    cache.put(('b', 'plain', 'en'), 3)
+
+    cache.invalidate('a')
+
+    assert cache.get(('a', 'plain', 'en')) is None
+    assert cache.get(('a', 'html', 'cs')) is None
+    assert cache.get(('b', 'plain', 'en')) == 3
+
+
+def test_disabled():
+    cache = RenderCache(maxsize=0)
+    cache.put(('a', 'plain'), 1)
+
+    assert cache.get(('a', 'plain')) is None
+
+
+def test_api_render_cache(api, user_opts):
+    nid = api.create(**user_opts)
+    nid2 = api.create(**user_opts)
+
+    first = api.get_notifications()
+    second = api.get_notifications('plain', 'en')
+
+    assert first == second
+    assert api.get_render_cache_stats()['hits'] == 2
+
+    # returned data are copies
+    second[nid]['actions']['foo'] = 'bar'
+    assert 'foo' not in api.get_rendered_notification(nid)['actions']
+
+    api.call_action(nid, 'dismiss')
+
+    assert api.get_render_cache_stats()['size'] == 1
+
+    api.plugins.reload()
+    api.get_rendered_notification(nid2)
+
+    assert api.get_render_cache_stats()['size'] == 1
+    assert api.get_render_cache_stats()['misses'] == 3
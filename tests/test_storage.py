@@ -0,0 +1,464 @@
+import fcntl
+import json
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from notifylib import Api, Sorting
+from notifylib.journalbackend import Journal, JournalStorageBackend
+from notifylib.notification import Notification
+from notifylib.notificationskeleton import NotificationSkeleton
+from notifylib.sqlitebackend import SqliteStorageBackend
+from notifylib.storagebackend import FileStorageBackend, flock
+from notifylib.watcher import InotifyWatcher, PollingWatcher
+
+
+@pytest.fixture(params=['inotify', 'poll'])
+def watcher_config(request, config_dict):
+    config_dict['settings']['watcher'] = request.param
+    return config_dict
+
+
+@pytest.fixture(params=[('files', 'inotify'), ('files', 'poll'), ('journal', 'auto'), ('sqlite', 'auto')])
+def storage_config(request, config_dict):
+    backend, watcher = request.param
+    config_dict['settings']['storage_backend'] = backend
+    config_dict['settings']['watcher'] = watcher
+    return config_dict
+
+
+@pytest.fixture
+def journal_config(config_dict):
+    config_dict['settings']['storage_backend'] = 'journal'
+    return config_dict
+
+
+def test_watcher_backend(watcher_config):
+    api = Api(confdict=watcher_config)
+    expected = InotifyWatcher if watcher_config['settings']['watcher'] == 'inotify' else PollingWatcher
+
+    assert isinstance(api.notifications.backend.watcher, expected)
+
+
+def test_default_storage_backend(api, user_opts, volatile_dir):
+    nid = api.create(**user_opts)
+
+    assert isinstance(api.notifications.backend, FileStorageBackend)
+    assert volatile_dir.join('{}.json'.format(nid)).check()
+
+
+def test_sync_created_elsewhere(storage_config, user_opts):
+    reader = Api(confdict=storage_config)
+    writer = Api(confdict=storage_config)
+
+    assert len(reader.get_notifications()) == 0
+
+    nid = writer.create(**user_opts)
+    user_opts['persistent'] = True
+    nid2 = writer.create(**user_opts)
+
+    notifications = reader.get_notifications()
+
+    assert set(notifications) == {nid, nid2}
+
+
+def test_sync_dismissed_elsewhere(storage_config, user_opts):
+    reader = Api(confdict=storage_config)
+    writer = Api(confdict=storage_config)
+
+    nid = writer.create(**user_opts)
+    nid2 = writer.create(**user_opts)
+
+    assert len(reader.get_notifications()) == 2
+
+    writer.call_action(nid, 'dismiss')
+
+    assert set(reader.get_notifications()) == {nid2}
+
+
+def test_journal_single_file(journal_config, user_opts, volatile_dir, persistent_dir):
+    api = Api(confdict=journal_config)
+
+    for _ in range(3):
+        api.create(**user_opts)
+
+    assert isinstance(api.notifications.backend, JournalStorageBackend)
+    assert [p.basename for p in volatile_dir.listdir() if p.ext == '.json'] == []
+    records = volatile_dir.join(JournalStorageBackend.JOURNAL_NAME).readlines()
+    assert len([r for r in records if r.startswith('create ')]) == 3
+    # skeleton definition is stored only once
+    assert len([r for r in records if r.startswith('skeleton ')]) == 1
+
+    assert len(Api(confdict=journal_config).get_notifications()) == 3
+
+
+def test_journal_dismiss_only_once(journal_config, user_opts):
+    api = Api(confdict=journal_config)
+    api2 = Api(confdict=journal_config)
+
+    nid = api.create(**user_opts)
+    n = api2.notifications.get(nid)
+
+    assert api.notifications.remove_from_fs(nid) is True
+    assert api2.notifications.remove_from_fs(n.notif_id) is False
+
+
+def test_journal_compaction(journal_config, user_opts, volatile_dir, monkeypatch):
+    monkeypatch.setattr(Journal, 'COMPACT_MIN_DEAD', 4)
+
+    api = Api(confdict=journal_config)
+    reader = Api(confdict=journal_config)
+    nids = [api.create(**user_opts) for _ in range(5)]
+
+    assert len(reader.get_notifications()) == 5
+
+    for nid in nids[:4]:
+        api.call_action(nid, 'dismiss')
+
+    journal = volatile_dir.join(JournalStorageBackend.JOURNAL_NAME)
+    assert len(journal.readlines()) < 9
+
+    assert set(reader.get_notifications()) == {nids[4]}
+    assert set(Api(confdict=journal_config).get_notifications()) == {nids[4]}
+
+
+def test_sqlite_single_database(config_dict, user_opts, volatile_dir, persistent_dir):
+    config_dict['settings']['storage_backend'] = 'sqlite'
+    api = Api(confdict=config_dict)
+
+    api.create(**user_opts)
+    user_opts['persistent'] = True
+    api.create(**user_opts)
+
+    assert isinstance(api.notifications.backend, SqliteStorageBackend)
+    assert [p for p in volatile_dir.listdir() if p.ext == '.json'] == []
+    assert volatile_dir.join(SqliteStorageBackend.DB_NAME).check()
+    assert persistent_dir.join(SqliteStorageBackend.DB_NAME).check()
+
+    assert len(Api(confdict=config_dict).get_notifications()) == 2
+
+
+def test_lookup_by_timestamp_collision(api, user_opts, monkeypatch):
+    monkeypatch.setattr(Notification, 'now', staticmethod(lambda: 1500000000))
+
+    nid = api.create(**user_opts)
+    nid2 = api.create(**user_opts)
+
+    # first stored notification wins
+    assert api.notifications.get('1500000000').notif_id == nid
+
+    api.call_action('1500000000', 'dismiss')
+
+    assert api.notifications.get('1500000000').notif_id == nid2
+
+    api.call_action('1500000000', 'dismiss')
+
+    assert api.notifications.get('1500000000') is None
+
+
+@pytest.mark.parametrize('length', [1, 4, 8, 31, 32])
+def test_lookup_by_prefix(api, user_opts, length):
+    nid = api.create(**user_opts)
+
+    assert api.notifications.get(nid[:length]).notif_id == nid
+
+
+def test_lookup_by_ambiguous_prefix(api, user_opts):
+    nids = [api.create(**user_opts) for _ in range(20)]
+    # at least two of twenty ids share the first hex digit
+    first_chars = [nid[0] for nid in nids]
+    ambiguous = next(c for c in first_chars if first_chars.count(c) > 1)
+
+    assert api.notifications.get(ambiguous) is None
+    assert api.notifications.get('') is None
+
+
+def test_default_file_format_readable_by_older_versions(api, user_opts, volatile_dir):
+    nid = api.create(**user_opts)
+    data = json.loads(volatile_dir.join('{}.json'.format(nid)).read())
+
+    # older versions pass stored attributes directly to constructors
+    assert set(data) == set(Notification.ATTRS)
+    assert set(data['skeleton']) == set(NotificationSkeleton.ATTRS)
+    assert data['api_version'] == Notification.API_VERSION
+
+
+def test_compact_format(config_dict, user_opts, volatile_dir, persistent_dir):
+    config_dict['settings']['file_format'] = 2
+    api = Api(confdict=config_dict)
+    nid = api.create(**user_opts)
+    content = volatile_dir.join('{}.json'.format(nid)).read()
+    data = json.loads(content)
+
+    assert '\n' not in content
+    assert data['format'] == Notification.FORMAT_VERSION
+    assert set(data['skeleton']) == {'plugin_name', 'name', 'version', 'hash'}
+    assert persistent_dir.join('skeletons', '{}.json'.format(data['skeleton']['hash'])).check()
+
+
+@pytest.mark.parametrize('file_format', [1, 2])
+def test_skeletons_interned(config_dict, user_opts, file_format):
+    config_dict['settings']['file_format'] = file_format
+    writer = Api(confdict=config_dict)
+    nids = [writer.create(**user_opts) for _ in range(3)]
+
+    reader = Api(confdict=config_dict)
+    skeletons = {id(n.skeleton) for n in reader.notifications.get_many(nids).values()}
+
+    assert skeletons == {id(reader.plugins.get_skeleton(user_opts['skel_id']))}
+    assert len(reader.plugins.skeletons) == 1
+
+
+def test_intern_skeleton_by_content(api, user_opts):
+    skel = api.plugins.get_skeleton(user_opts['skel_id'])
+    definition = skel.serialize()
+
+    assert api.plugins.intern_skeleton(dict(definition)) is skel
+    assert api.plugins.find_skeleton(skel.get_reference()) is skel
+
+    definition['timeout'] = 42
+    assert api.plugins.intern_skeleton(definition) is not skel
+
+
+def test_load_legacy_format(api, user_opts, volatile_dir):
+    nid = api.create(**user_opts)
+    n = api.notifications.get(nid)
+
+    legacy = n._serialize_data(Notification.ATTRS)
+    legacy['notif_id'] = 'f' * 32
+    volatile_dir.join('{}.json'.format(legacy['notif_id'])).write(json.dumps(legacy, indent=4))
+
+    reader = Api()
+    rendered = reader.get_rendered_notification(legacy['notif_id'])
+
+    assert rendered['message'] == api.get_rendered_notification(nid)['message']
+
+
+def test_load_with_stored_skeleton_definition(storage_config, user_opts, tmpdir):
+    api = Api(confdict=storage_config)
+    nid = api.create(**user_opts)
+    message = api.get_rendered_notification(nid)['message']
+
+    # plugin is not available anymore, skeleton definition has to be loaded from storage
+    storage_config['settings']['plugin_dir'] = tmpdir.mkdir('no_plugins')
+    reader = Api(confdict=storage_config)
+    n = reader.notifications.get(nid)
+
+    assert n.skeleton.actions == api.notifications.get(nid).skeleton.actions
+    assert reader.get_rendered_notification(nid)['message'] == message
+
+
+def test_fallback_loaded_on_demand(storage_config, user_opts):
+    api = Api(confdict=storage_config)
+    nid = api.create(**user_opts)
+    message = api.get_rendered_notification(nid)['message']
+
+    for n in [api.notifications.get(nid), Api(confdict=storage_config).notifications.get(nid)]:
+        # fallback is kept only on disk unless backend can't load it again
+        assert (n._fallback is None) == api.notifications.backend.supports_fallback_loading
+        assert n.fallback['plain'] == message
+        assert not hasattr(n, '__dict__')
+        assert not hasattr(n.skeleton, '__dict__')
+
+
+def test_create_many_synced_elsewhere(storage_config, user_opts, volatile_dir, persistent_dir):
+    reader = Api(confdict=storage_config)
+    writer = Api(confdict=storage_config)
+
+    assert len(reader.get_notifications()) == 0
+
+    items = [dict(user_opts, persistent=bool(i % 2)) for i in range(10)]
+    nids = [r['id'] for r in writer.create_many(items)]
+
+    assert set(reader.get_notifications()) == set(nids)
+    # no temporary files are left behind
+    assert [p for p in volatile_dir.listdir() + persistent_dir.listdir() if p.ext == '.tmp'] == []
+
+
+def test_sync_waits_for_writer(watcher_config, user_opts):
+    reader = Api(confdict=watcher_config)
+    reader.notifications.sync()
+    synced = threading.Event()
+
+    Api(confdict=watcher_config).create(**user_opts)
+
+    # other instance is in the middle of renaming batch
+    with flock(reader.notifications.backend.lock_path, fcntl.LOCK_EX):
+        thread = threading.Thread(target=lambda: (reader.get_notifications(), synced.set()))
+        thread.start()
+
+        assert not synced.wait(0.2)
+
+    thread.join()
+
+    assert len(reader.get_notifications()) == 1
+
+
+def test_shared_lock_without_lock_file(tmpdir):
+    with flock(str(tmpdir.join('missing', 'notifications.lock')), fcntl.LOCK_SH):
+        pass
+def test_sorted_views(api, user_opts, monkeypatch):
+    for ts, severity in enumerate(['info', 'error', 'warning', 'error', 'announcement', 'info'], start=1500000000):
+        monkeypatch.setattr(Notification, 'now', staticmethod(lambda: ts))
+        user_opts['severity'] = severity
+        api.create(**user_opts)
+
+    storage = api.notifications
+    dismissed = storage.query(sort='severity')[1]['id']
+    api.call_action(dismissed, 'dismiss')
+
+    for criterion in ['timestamp', 'severity']:
+        expected = sorted(storage.notifications.values(), key=Sorting.NOTIFICATION_KEYS[criterion], reverse=True)
+
+        assert list(storage._ordered(criterion)) == expected
+        assert len(storage.sorted_views[criterion]) == 5
+
+    assert [n.timestamp for n in storage._ordered('timestamp', since=1500000004)] == [1500000005, 1500000004]
+
+
+def test_deprecated_sort_by(api, user_opts, monkeypatch):
+    for ts, severity in enumerate(['info', 'error', 'warning'], start=1500000000):
+        monkeypatch.setattr(Notification, 'now', staticmethod(lambda: ts))
+        api.create(severity=severity, **user_opts)
+
+    for criterion in ['timestamp', 'severity']:
+        with pytest.deprecated_call():
+            rendered = Sorting.sort_by(api.get_notifications(), criterion)
+
+        assert list(rendered) == list(api.get_notifications(sort=criterion))
+
+
+def test_expiry(api, user_opts, monkeypatch):
+    now = 1500000000
+    monkeypatch.setattr(Notification, 'now', staticmethod(lambda: now))
+
+    nid = api.create(timeout=100, **user_opts)
+    nid2 = api.create(timeout=50, **user_opts)
+    nid3 = api.create(**user_opts)
+
+    assert api.get_next_expiry() == now + 50
+
+    api.call_action(nid2, 'dismiss')
+
+    # stale entry of dismissed notification is skipped
+    assert api.get_next_expiry() == now + 100
+    assert len(api.notifications.expiry_heap) == 1
+
+    now += 100
+
+    assert set(api.get_notifications()) == {nid3}
+    assert api.get_next_expiry() is None
+    assert nid not in api.notifications.notifications
+
+
+def test_expiry_heap_pruned(api, user_opts, monkeypatch):
+    monkeypatch.setattr(api.notifications, 'EXPIRY_HEAP_SLACK', 2)
+
+    nids = [api.create(timeout=1000, **user_opts) for _ in range(10)]
+    api.dismiss_many(nids[:8])
+
+    heap_ids = [nid for _, nid in api.notifications.expiry_heap]
+
+    assert set(nids[8:]) <= set(heap_ids)
+    # stale entries are dropped once they outnumber live ones
+    assert len(heap_ids) <= 2 + 2 * 2
+
+
+@pytest.mark.parametrize('load_workers', [1, 4])
+def test_cold_load(config_dict, user_opts, load_workers):
+    config_dict['settings']['load_workers'] = load_workers
+    count = FileStorageBackend.PARALLEL_LOAD_MIN * 2
+
+    items = [dict(user_opts, persistent=bool(i % 2)) for i in range(count)]
+    nids = [r['id'] for r in Api(confdict=config_dict).create_many(items)]
+
+    notifications = Api(confdict=config_dict).notifications.get_all()
+
+    assert set(notifications) == set(nids)
+    # identical skeleton definitions are instantiated only once
+    assert len({id(n.skeleton) for n in notifications.values()}) == 1
+
+
+STRESS_WORKER = """
+import json, sys
+from notifylib import Api
+
+api = Api(confdict=json.loads(sys.argv[1]))
+shared = json.loads(sys.argv[2])
+kept = []
+
+api.dismiss_many(shared)
+
+for i in range(int(sys.argv[3])):
+    nid = api.create('simple.simple', data={'message': 'stress'}, persistent=bool(i % 3))
+    api.get_notifications(sort='timestamp', limit=10)
+    api.query_notifications()
+
+    if i % 2:
+        api.call_action(nid, 'dismiss')
+    else:
+        kept.append(nid)
+
+print(json.dumps(kept))
+"""
+
+
+def test_concurrent_create_list_dismiss(storage_config, user_opts):
+    """Threads sharing one Api and other processes modify the same storage at once"""
+    iterations = 20
+    confdict = {'settings': {k: str(v) for k, v in storage_config['settings'].items()}}
+
+    api = Api(confdict=storage_config)
+    shared = [api.create(**user_opts) for _ in range(10)]
+
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-c', STRESS_WORKER, json.dumps(confdict), json.dumps(shared), str(iterations)],
+            stdout=subprocess.PIPE
+        )
+        for _ in range(3)
+    ]
+
+    kept = set()
+    errors = []
+
+    def worker():
+        try:
+            api.dismiss_many(shared)
+
+            for i in range(iterations):
+                nid = api.create(persistent=bool(i % 3), **user_opts)
+                api.get_notifications(sort='timestamp', limit=10)
+                api.query_notifications()
+
+                if i % 2:
+                    api.call_action(nid, 'dismiss')
+                else:
+                    kept.add(nid)
+        except Exception as e:
+            errors.append(e)
+
+    # switch threads as often as possible to provoke races
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    for p in processes:
+        out, _ = p.communicate(timeout=60)
+        assert p.returncode == 0
+        kept.update(json.loads(out.decode()))
+
+    assert not errors
+    assert len(kept) == 7 * iterations // 2
+    assert set(api.get_notifications()) == kept
+    assert set(Api(confdict=storage_config).get_notifications()) == kept
@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+from notifylib.jobs import JobStore
+from notifylib.supervisor import OutputBuffer, Supervisor
+
+
+def test_no_zombie_children():
+    for _ in range(3):
+        Supervisor().run('/bin/true', None, 10)
+
+    # intermediate children are reaped, commands are reparented to init
+    with pytest.raises(ChildProcessError):
+        os.waitpid(-1, os.WNOHANG)
+
+
+@pytest.mark.parametrize('cmd, state, returncode', [
+    ('/bin/true', JobStore.FINISHED, 0),
+    ('sleep 10', JobStore.TIMED_OUT, -15),
+    ('/nonexistent/command', JobStore.FAILED, None),
+])
+def test_job_record(tmpdir, cmd, state, returncode):
+    jobs = JobStore(str(tmpdir.join('jobs')))
+    job = run_job(jobs, cmd, 1)
+
+    assert job['state'] == state
+    assert job['returncode'] == returncode
+
+
+def test_output_captured(tmpdir):
+    jobs = JobStore(str(tmpdir.join('jobs')))
+    # much more output than pipe buffer, command must not block on it
+    job = run_job(jobs, "sh -c 'yes | head -c 1000000; echo done >&2'", 10)
+
+    assert job['state'] == JobStore.FINISHED
+    assert job['returncode'] == 0
+    assert job['duration'] < 5
+    assert job['stdout'].startswith("[{} bytes truncated]\n".format(1000000 - OutputBuffer.LIMIT))
+    assert job['stdout'].endswith("y\n" * 10)
+    assert job['stderr'] == "done\n"
+
+
+def test_output_buffer():
+    output = OutputBuffer('stdout', limit=8)
+    output.write(b'abc\n')
+    assert output.getvalue() == 'abc\n'
+
+    output.write(b'defghijk')
+    assert output.getvalue() == '[4 bytes truncated]\ndefghijk'
+
+
+def run_job(jobs, cmd, timeout):
+    record = jobs.new(cmd)
+
+    Supervisor(jobs, record).run(cmd, None, timeout)
+
+    deadline = time.monotonic() + 10
+    while jobs.get(record['id'])['state'] in (JobStore.QUEUED, JobStore.RUNNING) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    return jobs.get(record['id'])